@@ -1,10 +1,15 @@
-import aiohttp
 import asyncio
 import pandas as pd
 import logging
 from tqdm import tqdm
-import random
 import os
+import time
+
+from ratelimit import AsyncRateLimiter
+from http_session import ConnectionStats, create_session
+from resilience import RetryPolicy, CircuitOpenError, RETRYABLE_STATUSES
+from xlsx_rows import iter_rows, row_count
+import results_store
 
 logging.basicConfig(
     level=logging.INFO,
@@ -30,69 +35,149 @@ HEADERS = {
 BASE_URL = "https://www.chipdip.ru/searchajax?searchtext={}"
 
 CONCURRENT_REQUESTS = 5
-DELAY_BETWEEN_REQUESTS = (0.2, 0.6)
 MAX_RETRIES = 3
+READ_BATCH = 500  # строк Excel между передачей управления event loop — запросы идут, пока файл читается
+FLUSH_ROWS = 2000      # промежуточный output.xlsx, когда готовый префикс вырос на N строк...
+FLUSH_SECONDS = 120    # ...и прошло не меньше T секунд с прошлой записи
+RUN_HEADER = ["item", "price_rub", "source_site"]  # колонки прогона в results_store (price_rub — float64)
+SOURCE_SITE = "chipdip.ru"
+
+# темп и параллелизм к chipdip подстраиваются по ответам (429/503 → сбавляем)
+limiter = AsyncRateLimiter(rate=2.0, max_rate=10.0, limit=2, max_limit=CONCURRENT_REQUESTS)
+# повторы с джиттером; если chipdip лежит, выключатель отклоняет запросы сразу, без таймаутов
+conn_stats = ConnectionStats()
+retry = RetryPolicy(attempts=MAX_RETRIES, base_delay=0.5, max_delay=8.0, failure_threshold=5, reset_timeout=30.0)
 
 
 async def fetch_price(session, semaphore, item_name):
-    """Парсинг цены для одного товара с повторами"""
+    """Парсинг цены для одного товара с повторами (resilience.py)"""
     url = BASE_URL.format(item_name)
-    async with semaphore:
-        for attempt in range(1, MAX_RETRIES + 1):
-            try:
-                async with session.get(url, headers=HEADERS) as resp:
-                    if resp.status != 200:
-                        logging.warning(f"Ошибка {resp.status} для {item_name} (попытка {attempt})")
-                        await asyncio.sleep(1)
-                        continue
-
-                    data = await resp.json()
-                    prices = []
-                    for product in data.get("products", []):
-                        for offer in product.get("offers", []):
-                            if "price" in offer:
-                                try:
-                                    prices.append(float(offer["price"]))
-                                except Exception:
-                                    pass
-
-                    await asyncio.sleep(random.uniform(*DELAY_BETWEEN_REQUESTS))
-                    return max(prices) if prices else None
-
-            except Exception as e:
-                logging.error(f"Ошибка при {item_name} (попытка {attempt}): {e}")
-                await asyncio.sleep(1)
 
+    async def attempt():
+        # слот занимается на попытку: пауза перед повтором не держит его за собой
+        async with semaphore, limiter.slot(url) as slot, session.get(url) as resp:
+            slot.record(resp.status, resp.headers.get("Retry-After"))
+            if resp.status != 200:
+                return resp.status, None
+            return resp.status, await resp.json()
+
+    try:
+        status, data = await retry.run("chipdip.ru", attempt,
+                                       retry_if=lambda r: r[0] in RETRYABLE_STATUSES)
+    except CircuitOpenError:
+        return None
+    except Exception as e:
+        logging.error(f"Ошибка при {item_name}: {e}")
         return None
 
+    if status != 200:
+        logging.warning(f"Ошибка {status} для {item_name}")
+        return None
 
-async def process_excel(input_file, output_file):
-    df = pd.read_excel(input_file)
+    prices = []
+    for product in data.get("products", []):
+        for offer in product.get("offers", []):
+            if "price" in offer:
+                try:
+                    prices.append(float(offer["price"]))
+                except Exception:
+                    pass
 
-    if df.shape[1] > 1:
-        df = df.iloc[:, [0]]
+    return max(prices) if prices else None
 
-    df.columns = ["Наименование"]
-    df["Цена"] = None
 
-    semaphore = asyncio.Semaphore(CONCURRENT_REQUESTS)
+class OrderedResults:
+    """
+    Буфер результатов по номеру строки.
+
+    Задачи завершаются в произвольном порядке (as_completed), поэтому каждая
+    несёт свой индекс и кладёт цену в заранее выделенную ячейку. prefix —
+    длина готового непрерывного начала: его можно записывать в output.xlsx,
+    не дожидаясь остальных строк.
+    """
+
+    _PENDING = object()
+
+    def __init__(self, size: int = 0):
+        self.values = [self._PENDING] * size
+        self.prefix = 0
+
+    def reserve(self, index: int):
+        if index >= len(self.values):
+            self.values.extend([self._PENDING] * (index + 1 - len(self.values)))
+
+    def set(self, index: int, value) -> int:
+        """Записывает результат строки index; возвращает, на сколько вырос готовый префикс."""
+        self.values[index] = value
+        start = self.prefix
+        while self.prefix < len(self.values) and self.values[self.prefix] is not self._PENDING:
+            self.prefix += 1
+        return self.prefix - start
 
-    async with aiohttp.ClientSession() as session:
-        tasks = [
-            fetch_price(session, semaphore, str(row["Наименование"]))
-            for _, row in df.iterrows()
-        ]
+    def ready(self) -> list:
+        return self.values[:self.prefix]
 
-        results = []
-        with tqdm(total=len(tasks), desc="Парсинг", unit="товар", ncols=100) as pbar:
+
+async def _indexed(index, coro):
+    return index, await coro
+
+
+def _results_frame(names, prices) -> pd.DataFrame:
+    df = pd.DataFrame({"Наименование": names[:len(prices)]})
+    df["Цена"] = pd.to_numeric(pd.Series(prices, dtype="object"), errors="coerce")
+    return df
+
+
+def _write_xlsx(df: pd.DataFrame, output_file: str):
+    # через временный файл: прерванная запись не портит предыдущий output.xlsx
+    tmp_path = output_file + ".tmp.xlsx"
+    df.to_excel(tmp_path, index=False)
+    os.replace(tmp_path, output_file)
+
+
+async def process_excel(input_file, output_file):
+    # первый столбец читается потоково (xlsx_rows.py): запросы стартуют с первых строк
+    names = []
+    semaphore = asyncio.Semaphore(CONCURRENT_REQUESTS)
+    results = OrderedResults((row_count(input_file) or 1) - 1)
+
+    # заголовки и пул соединений (keep-alive, DNS-кэш) — на всю сессию, см. http_session.py
+    async with create_session(HEADERS, stats=conn_stats, limit_per_host=CONCURRENT_REQUESTS) as session:
+        tasks = []
+        with tqdm(total=len(results.values), desc="Парсинг", unit="товар", ncols=100) as pbar:
+            for (name,) in iter_rows(input_file, columns=(0,), min_row=2):
+                index = len(names)
+                names.append(str(name))
+                results.reserve(index)
+                tasks.append(asyncio.ensure_future(_indexed(index, fetch_price(session, semaphore, str(name)))))
+                if len(tasks) % READ_BATCH == 0:
+                    await asyncio.sleep(0)
+            del results.values[len(names):]  # в <dimension> могли попасть пустые строки
+            pbar.total = len(tasks)
+            pbar.refresh()
+
+            flushed, last_flush = 0, time.monotonic()
             for f in asyncio.as_completed(tasks):
-                res = await f
-                results.append(res)
+                index, res = await f
+                results.set(index, res)
                 pbar.update(1)
-
-    df["Цена"] = results
-    df.to_excel(output_file, index=False)
-    logging.info(f"Готово! Результат сохранён в {output_file}")
+                pbar.set_postfix_str(f"готово подряд: {results.prefix}", refresh=False)
+                if (results.prefix - flushed >= FLUSH_ROWS
+                        and time.monotonic() - last_flush >= FLUSH_SECONDS):
+                    _write_xlsx(_results_frame(names, results.ready()), output_file)
+                    flushed, last_flush = results.prefix, time.monotonic()
+
+    df = _results_frame(names, results.ready())
+
+    # прогон — в Parquet (results_store.py: те же разделы и id, что у остальных парсеров), XLSX — экспорт
+    prices = df["Цена"].astype(object).where(df["Цена"].notna(), None)  # NaN → пустая цена
+    rows = ((name, price, SOURCE_SITE) for name, price in zip(df["Наименование"], prices))
+    run_path = results_store.write_run(os.path.join(os.path.dirname(output_file), "runs"), RUN_HEADER, rows)
+    _write_xlsx(df, output_file)
+    logging.info(f"Готово! Результат сохранён в {output_file} (прогон: {run_path})")
+    logging.info(f"Темп по хостам:\n{limiter.stats()}")
+    logging.info(f"Повторы и выключатели:\n{retry.stats()}")
+    logging.info(conn_stats.report())
 
 
 if __name__ == "__main__":
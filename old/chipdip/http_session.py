@@ -0,0 +1,126 @@
+"""
+http_session.py
+
+Копия firstParser/http_session.py: docker-образ собирается только из этой папки.
+
+Общая фабрика aiohttp-сессий с настроенным пулом соединений.
+
+aiohttp.ClientSession() по умолчанию: 100 соединений на всё, без предела
+на хост, DNS-кэш на 10 с, keep-alive 15 с. На 35k запросов к одним и тем же
+четырём хостам это лишние DNS-запросы и TLS-рукопожатия после каждой паузы.
+Здесь:
+
+- limit_per_host — не больше N открытых соединений к одному хосту
+  (лишние запросы ждут свободное, а не открывают новое);
+- ttl_dns_cache — адреса хоста кэшируются на 10 минут;
+- keepalive_timeout — простаивающее соединение живёт 60 с, поэтому
+  пауза ограничителя темпа (ratelimit.py) не рвёт TLS-сессию;
+- happy_eyeballs_delay — IPv4/IPv6 пробуются параллельно (RFC 8305),
+  зависший адрес не съедает весь connect-таймаут;
+- enable_cleanup_closed — закрытие «полузакрытых» TLS-соединений.
+
+HTTP/2 aiohttp не поддерживает — переиспользование соединений HTTP/1.1
+keep-alive даёт основную часть выигрыша.
+
+ConnectionStats через TraceConfig считает по хостам новые и
+переиспользованные соединения, время их установки и попадания в DNS-кэш:
+
+    conn_stats = ConnectionStats()
+    async with create_session(HEADERS, stats=conn_stats) as session:
+        ...
+    print(conn_stats.report())
+"""
+
+import inspect
+import time
+from typing import Dict, Mapping, Optional
+
+import aiohttp
+
+CONNECTOR = dict(
+    limit=100,                  # соединений всего
+    limit_per_host=8,           # и к одному хосту
+    ttl_dns_cache=600,          # сек
+    keepalive_timeout=60,       # сек простоя до закрытия соединения
+    happy_eyeballs_delay=0.25,  # сек до попытки следующего адреса (RFC 8305)
+    enable_cleanup_closed=True,
+)
+
+
+class _HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.created = 0
+        self.reused = 0
+        self.connect_time = 0.0
+        self.dns_hits = 0
+        self.dns_misses = 0
+
+
+class ConnectionStats:
+    def __init__(self):
+        self.hosts: Dict[str, _HostStats] = {}
+
+    def _host(self, host: Optional[str]) -> _HostStats:
+        return self.hosts.setdefault(host or "?", _HostStats())
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        tc = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            ctx.host = params.url.host
+            self._host(ctx.host).requests += 1
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.connect_started = time.monotonic()
+
+        async def on_connection_create_end(session, ctx, params):
+            st = self._host(getattr(ctx, "host", None))
+            st.created += 1
+            st.connect_time += time.monotonic() - ctx.connect_started
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self._host(getattr(ctx, "host", None)).reused += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self._host(params.host).dns_hits += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self._host(params.host).dns_misses += 1
+
+        tc.on_request_start.append(on_request_start)
+        tc.on_connection_create_start.append(on_connection_create_start)
+        tc.on_connection_create_end.append(on_connection_create_end)
+        tc.on_connection_reuseconn.append(on_connection_reuseconn)
+        tc.on_dns_cache_hit.append(on_dns_cache_hit)
+        tc.on_dns_cache_miss.append(on_dns_cache_miss)
+        return tc
+
+    def report(self) -> str:
+        lines = []
+        for host, st in sorted(self.hosts.items()):
+            conns = st.created + st.reused
+            reuse = st.reused / conns if conns else 0.0
+            avg = st.connect_time / st.created * 1000 if st.created else 0.0
+            lines.append(f"{host}: {st.requests} запр., соединений новых {st.created} "
+                         f"(в среднем {avg:.0f} мс), повторно {st.reused} ({reuse:.0%}), "
+                         f"DNS-кэш {st.dns_hits}/{st.dns_hits + st.dns_misses}")
+        return "Соединения:\n" + "\n".join(lines) if lines else "Соединения: запросов не было"
+
+
+def make_connector(**overrides) -> aiohttp.TCPConnector:
+    params = {**CONNECTOR, **overrides}
+    # happy_eyeballs_delay появился в aiohttp 3.10 — на старых версиях просто не передаём
+    supported = inspect.signature(aiohttp.TCPConnector).parameters
+    return aiohttp.TCPConnector(**{k: v for k, v in params.items() if k in supported})
+
+
+def create_session(headers: Optional[Mapping[str, str]] = None, stats: Optional[ConnectionStats] = None,
+                   timeout: Optional[float] = None, **connector) -> aiohttp.ClientSession:
+    """ClientSession с общим пулом (CONNECTOR + connector); headers — на все запросы сессии."""
+    return aiohttp.ClientSession(
+        connector=make_connector(**connector),
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=timeout) if timeout else None,
+        trace_configs=[stats.trace_config()] if stats else None,
+    )
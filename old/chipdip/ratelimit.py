@@ -0,0 +1,212 @@
+"""
+ratelimit.py
+
+Копия firstParser/ratelimit.py: docker-образ собирается только из этой папки.
+
+Адаптивное ограничение нагрузки по хосту: token bucket + AIMD.
+
+Вместо общего Semaphore и фиксированных sleep у каждого хоста своё
+состояние (HostState):
+- темп запросов — token bucket (rate запросов/с, burst);
+- число одновременных запросов — окно limit.
+
+Оба параметра меняются по AIMD:
+- ответ без признаков перегрузки и с нормальной задержкой
+  (не хуже LATENCY_TOLERANCE × лучшей наблюдаемой) — аддитивный рост;
+- 429 / 503 / ошибка соединения — мультипликативное снижение,
+  а Retry-After блокирует хост на указанное время.
+
+Быстрые хосты так разгоняются до max_rate, медленные остаются
+на min_rate, и никто не платит фиксированную паузу на каждый запрос.
+
+AsyncRateLimiter — для aiohttp-скриптов, RateLimiter — для requests
+(потокобезопасен). Оба используются одинаково:
+
+    async with limiter.slot(url) as slot:      # with limiter.slot(url) as slot:
+        resp = ...
+        slot.record(resp.status, resp.headers.get("Retry-After"))
+"""
+
+import asyncio
+import email.utils
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+OVERLOAD_STATUSES = (429, 503)
+LATENCY_TOLERANCE = 2.0
+LATENCY_ALPHA = 0.2
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).hostname or url
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After: число секунд или HTTP-дата → секунды ожидания."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class Slot:
+    """Итог одного запроса; заполняется вызывающим через record()."""
+
+    def __init__(self):
+        self.status: Optional[int] = None
+        self.retry_after: Optional[float] = None
+
+    def record(self, status: int, retry_after: Optional[str] = None):
+        self.status = status
+        self.retry_after = parse_retry_after(retry_after)
+
+
+class HostState:
+    def __init__(self, rate: float = 1.0, burst: float = 2.0,
+                 min_rate: float = 0.2, max_rate: float = 20.0, rate_step: float = 0.25,
+                 limit: float = 2.0, min_limit: float = 1.0, max_limit: float = 32.0,
+                 decrease: float = 0.5):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate, self.max_rate, self.rate_step = min_rate, max_rate, rate_step
+        self.limit = limit
+        self.min_limit, self.max_limit = min_limit, max_limit
+        self.decrease = decrease
+
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.in_flight = 0
+        self.latency: Optional[float] = None  # EWMA
+        self.best_latency: Optional[float] = None
+
+        self.requests = 0
+        self.overloads = 0
+
+    def can_start(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает 0, либо сколько секунд подождать."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def on_response(self, status: Optional[int], latency: float, retry_after: Optional[float]):
+        self.requests += 1
+        if status is None or status in OVERLOAD_STATUSES:
+            self.overloads += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            return
+
+        self.latency = latency if self.latency is None else (
+            LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * self.latency)
+        self.best_latency = latency if self.best_latency is None else min(self.best_latency, latency)
+        if self.latency <= self.best_latency * LATENCY_TOLERANCE:
+            self.rate = min(self.max_rate, self.rate + self.rate_step)
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def report(self, host: str) -> str:
+        latency = f"{self.latency:.2f}с" if self.latency is not None else "-"
+        return (f"{host}: {self.requests} запр., перегрузок {self.overloads}, "
+                f"темп {self.rate:.2f}/с, окно {int(self.limit)}, задержка {latency}")
+
+
+class _Limiter:
+    def __init__(self, per_host: Optional[Dict[str, dict]] = None, **defaults):
+        """defaults — параметры HostState; per_host — переопределения по хосту."""
+        self.defaults = defaults
+        self.per_host = per_host or {}
+        self.hosts: Dict[str, HostState] = {}
+
+    def state(self, url: str) -> HostState:
+        host = host_of(url)
+        st = self.hosts.get(host)
+        if st is None:
+            st = self.hosts[host] = HostState(**{**self.defaults, **self.per_host.get(host, {})})
+        return st
+
+    def stats(self) -> str:
+        return "\n".join(st.report(host) for host, st in sorted(self.hosts.items()))
+
+
+class AsyncRateLimiter(_Limiter):
+    def __init__(self, per_host: Optional[Dict[str, dict]] = None, **defaults):
+        super().__init__(per_host, **defaults)
+        self._conds: Dict[str, asyncio.Condition] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        st = self.state(url)
+        cond = self._conds.setdefault(host_of(url), asyncio.Condition())
+        async with cond:
+            await cond.wait_for(st.can_start)
+            st.in_flight += 1
+        slot = Slot()
+        started = None
+        try:
+            while (wait := st.reserve()) > 0:
+                await asyncio.sleep(wait)
+            started = time.monotonic()
+            yield slot
+        except asyncio.CancelledError:
+            started = None  # отменённый запрос (fan-out) ничего не говорит о хосте
+            raise
+        finally:
+            if started is not None:
+                st.on_response(slot.status, time.monotonic() - started, slot.retry_after)
+            async with cond:
+                st.in_flight -= 1
+                cond.notify_all()
+
+
+class RateLimiter(_Limiter):
+    def __init__(self, per_host: Optional[Dict[str, dict]] = None, **defaults):
+        super().__init__(per_host, **defaults)
+        self._lock = threading.Lock()
+        self._conds: Dict[str, threading.Condition] = {}
+
+    @contextmanager
+    def slot(self, url: str):
+        with self._lock:
+            st = self.state(url)
+            cond = self._conds.setdefault(host_of(url), threading.Condition())
+        with cond:
+            cond.wait_for(st.can_start)
+            st.in_flight += 1
+        slot = Slot()
+        started = None
+        try:
+            while True:
+                with cond:
+                    wait = st.reserve()
+                if wait <= 0:
+                    break
+                time.sleep(wait)
+            started = time.monotonic()
+            yield slot
+        finally:
+            with cond:
+                if started is not None:
+                    st.on_response(slot.status, time.monotonic() - started, slot.retry_after)
+                st.in_flight -= 1
+                cond.notify_all()
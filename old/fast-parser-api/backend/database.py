@@ -1,34 +1,188 @@
 # backend/database.py
-import sqlite3
+"""
+Хранилище задач и прогресса (SQLite, /data/progress.db).
+
+Раньше каждый set_progress/get_progress открывал соединение, делал commit
+и закрывал его, а main.py и вовсе держал задачи в словаре в памяти —
+он терялся при перезапуске и не был общим для нескольких uvicorn-воркеров.
+Здесь:
+
+- одно долгоживущее соединение на запись (WAL, synchronous=NORMAL) на процесс;
+- прогресс копится в памяти и пишется пачкой не чаще раза в FLUSH_SECONDS,
+  смена статуса (done / error) пишется сразу;
+- опрос статуса читает через соединение только для чтения, своё у каждого
+  потока — без открытия соединения на каждый запрос;
+- WAL даёт читать из любого воркера, пока другой пишет; задачи переживают
+  перезапуск.
+
+Задача принадлежит процессу с идентификатором BOOT_ID (uuid на запуск;
+pid не годится — после перезапуска контейнера воркеры получают те же pid).
+Каждый процесс раз в HEARTBEAT_SECONDS отмечается в таблице workers;
+«processing» у задачи, чей владелец не отмечался дольше STALE_SECONDS,
+отдаётся как прерванная, а при старте такие задачи помечаются в БД.
+"""
+
+import json
 import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
 
 DB = "/data/progress.db"
-os.makedirs("/data", exist_ok=True)
-
-def init_db():
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS tasks (
-        task_id TEXT PRIMARY KEY,
-        progress INTEGER
-    )
-    """)
-    conn.commit()
-    conn.close()
+FLUSH_SECONDS = 0.5   # прогресс пишется в БД не чаще раза в N секунд
+BUSY_TIMEOUT_MS = 5000
+HEARTBEAT_SECONDS = 5  # процесс отмечается «жив» раз в N секунд...
+STALE_SECONDS = 30     # ...и его задачи считаются прерванными, если отметки нет дольше T
+BOOT_ID = uuid.uuid4().hex  # идентификатор этого процесса
+INTERRUPTED = "прервано перезапуском"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    task_id    TEXT PRIMARY KEY,
+    status     TEXT NOT NULL,
+    progress   INTEGER NOT NULL DEFAULT 0,
+    result     TEXT,
+    error      TEXT,
+    owner      TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    boot_id    TEXT PRIMARY KEY,
+    heartbeat  REAL NOT NULL
+)
+"""
+
+
+class ProgressStore:
+    def __init__(self, path: str = DB, flush_seconds: float = FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {}
+        self._last_flush = time.monotonic()
+        self._readers = threading.local()
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+            self._heartbeat()
+            self._recover()
+        self._stop = threading.Event()
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+
+    def _migrate(self):
+        # базы, где владелец задачи хранился как pid
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def _heartbeat(self):
+        self._conn.execute("INSERT OR REPLACE INTO workers (boot_id, heartbeat) VALUES (?, ?)",
+                           (BOOT_ID, time.time()))
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            with self._lock:
+                self._flush()
+                with self._conn:
+                    self._heartbeat()
+
+    def _recover(self):
+        # задачи процессов, переставших отмечаться (перезапуск контейнера), уже не завершатся
+        stale = time.time() - STALE_SECONDS
+        self._conn.execute("""
+            UPDATE jobs SET status='error', error=?, updated_at=?
+            WHERE status='processing' AND owner IS NOT ?
+              AND NOT EXISTS (SELECT 1 FROM workers w WHERE w.boot_id = jobs.owner AND w.heartbeat >= ?)
+        """, (INTERRUPTED, time.time(), BOOT_ID, stale))
+        self._conn.execute("DELETE FROM workers WHERE heartbeat < ?", (stale,))
+
+    # ---------- запись ----------
+    def create(self, task_id: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (task_id, status, progress, owner, updated_at)"
+                " VALUES (?, 'processing', 0, ?, ?)", (task_id, BOOT_ID, time.time()))
+
+    def set_progress(self, task_id: str, value: int):
+        with self._lock:
+            self._pending[task_id] = int(value)
+            if time.monotonic() - self._last_flush >= self.flush_seconds:
+                self._flush()
+
+    def _flush(self):
+        if self._pending:
+            now = time.time()
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE jobs SET progress=?, updated_at=? WHERE task_id=?",
+                    [(value, now, task_id) for task_id, value in self._pending.items()])
+            self._pending.clear()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def finish(self, task_id: str, result: Any):
+        with self._lock, self._conn:
+            self._pending.pop(task_id, None)
+            self._conn.execute(
+                "UPDATE jobs SET status='done', progress=100, result=?, updated_at=? WHERE task_id=?",
+                (json.dumps(result, ensure_ascii=False), time.time(), task_id))
+
+    def fail(self, task_id: str, error: str):
+        with self._lock, self._conn:
+            self._pending.pop(task_id, None)
+            self._conn.execute("UPDATE jobs SET status='error', error=?, updated_at=? WHERE task_id=?",
+                               (error, time.time(), task_id))
+
+    # ---------- чтение ----------
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._readers.conn = conn
+        return conn
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._reader().execute("""
+            SELECT j.status, j.progress, j.result, j.error, w.heartbeat
+            FROM jobs j LEFT JOIN workers w ON w.boot_id = j.owner
+            WHERE j.task_id=?""", (task_id,)).fetchone()
+        if row is None:
+            return None
+        status, progress, result, error, heartbeat = row
+        if status == "processing" and (heartbeat is None or heartbeat < time.time() - STALE_SECONDS):
+            status, error = "error", INTERRUPTED  # владелец задачи перестал отмечаться
+        job = {"status": status, "progress": progress,
+               "result": json.loads(result) if result is not None else None}
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+
+store = ProgressStore(DB)
+
 
 def set_progress(task_id: str, value: int):
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO tasks (task_id, progress) VALUES (?, ?)",
-              (task_id, int(value)))
-    conn.commit()
-    conn.close()
+    store.set_progress(task_id, value)
+
 
 def get_progress(task_id: str) -> int:
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
-    c.execute("SELECT progress FROM tasks WHERE task_id=?", (task_id,))
-    row = c.fetchone()
-    conn.close()
-    return int(row[0]) if row else 0
+    job = store.get(task_id)
+    return job["progress"] if job else 0
@@ -4,6 +4,7 @@ import threading
 from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from scraper import run_scraper
+from database import store
 
 app = FastAPI()
 
@@ -15,8 +16,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-tasks = {}
-
+# задачи и прогресс — в SQLite (database.py): общие для всех воркеров и переживают перезапуск
 @app.get("/")
 def root():
     return {"status": "ok", "message": "PriceSet Parser running"}
@@ -29,14 +29,14 @@ async def upload(file: UploadFile = File(...)):
     with open(file_path, "wb") as f:
         f.write(await file.read())
 
-    tasks[job_id] = {"status": "processing", "progress": 0, "result": None}
+    store.create(job_id)
 
     threading.Thread(
-        target=run_scraper, args=(job_id, file_path, tasks)
+        target=run_scraper, args=(job_id, file_path, store)
     ).start()
 
     return {"task_id": job_id}
 
 @app.get("/progress/{task_id}")
 def progress(task_id: str):
-    return tasks.get(task_id, {"status": "not_found"})
+    return store.get(task_id) or {"status": "not_found"}
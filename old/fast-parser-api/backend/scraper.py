@@ -1,16 +1,18 @@
 import requests
-import openpyxl
-import time
-from typing import Dict, Any
 
+from database import ProgressStore
+from ratelimit import RateLimiter
+from xlsx_rows import iter_rows, row_count
+
+# общий на все задачи темп к chipdip, подстраивается по ответам API
+limiter = RateLimiter(rate=1.0, min_rate=0.2, max_rate=5.0)
 
-def run_scraper(job_id: str, file_path: str, tasks: Dict[str, Any]):
-    try:
-        wb = openpyxl.load_workbook(file_path)
-        ws = wb.active
 
-        rows = list(ws.iter_rows(min_row=2, values_only=True))  # пропускаем заголовок
-        total = len(rows)
+def run_scraper(job_id: str, file_path: str, store: ProgressStore):
+    try:
+        # строки читаются потоково (xlsx_rows.py), число строк — из <dimension> листа
+        total = max((row_count(file_path) or 2) - 1, 1)
+        rows = iter_rows(file_path, columns=(0, 1), min_row=2)  # пропускаем заголовок
         results = []
 
         for i, (name, target_price) in enumerate(rows, start=1):
@@ -21,11 +23,13 @@ def run_scraper(job_id: str, file_path: str, tasks: Dict[str, Any]):
             for part in query.replace("/", " ").split():
                 if "-" in part or part.isalnum():
                     try:
-                        r = requests.get(
-                            "https://www.chipdip.ru/search",
-                            params={"searchtext": part, "json": "1"},
-                            timeout=10,
-                        )
+                        with limiter.slot("https://www.chipdip.ru/search") as slot:
+                            r = requests.get(
+                                "https://www.chipdip.ru/search",
+                                params={"searchtext": part, "json": "1"},
+                                timeout=10,
+                            )
+                            slot.record(r.status_code, r.headers.get("Retry-After"))
                         if r.status_code == 200:
                             data = r.json()
                             for item in data.get("Result", []):
@@ -53,13 +57,10 @@ def run_scraper(job_id: str, file_path: str, tasks: Dict[str, Any]):
                     "match": False
                 })
 
-            tasks[job_id]["progress"] = int(i / total * 100)
-            time.sleep(1)  # чтобы не спамить API
+            # в БД уходит не чаще раза в FLUSH_SECONDS (database.py)
+            store.set_progress(job_id, min(int(i / total * 100), 99))
 
-        tasks[job_id]["progress"] = 100
-        tasks[job_id]["status"] = "done"
-        tasks[job_id]["result"] = results
+        store.finish(job_id, results)
 
     except Exception as e:
-        tasks[job_id]["status"] = "error"
-        tasks[job_id]["error"] = str(e)
+        store.fail(job_id, str(e))
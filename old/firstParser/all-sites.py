@@ -3,14 +3,31 @@
 """
 Боевой парсер поиска по списку сайтов + конкретные реализации для Citilink и KartridgMSK.
 Python 3.12
+
+Асинхронный: все пары (запрос, сайт) идут одновременно, темп и параллелизм
+к каждому хосту ограничивает ratelimit.py, повторы и выключатели — resilience.py.
+
+У сайта без своего парсера несколько кандидатов на URL поиска
+(/search/?q=, /search/?text=, ...). Они опрашиваются параллельно
+(fanout.race_sites, режим "ordered" — побеждает шаблон, стоящий выше,
+как в прежнем переборе по очереди), а сработавший шаблон запоминается
+(TemplateMemory, site_templates.json): следующие запросы к сайту идут
+только по нему. Шаблоны, на которые сайт ответил 404/410, больше не пробуются.
 """
 
-import requests
-from bs4 import BeautifulSoup
-import re
-import time
+import asyncio
+import json
+import os
 import urllib.parse
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from extractors import extract_match
+from fanout import race_sites
+from http_fetch import Fetched, ValidatorStore, fetch_async
+from http_session import ConnectionStats, create_session
+from parse_pool import ParsePool
+from ratelimit import AsyncRateLimiter
+from resilience import RetryPolicy, RETRYABLE_STATUSES
 
 # --- Настройки поиска ---
 SITES = [
@@ -36,12 +53,11 @@ QUERIES = [
     "RM1-1740-040CN",
 ]
 
-# Заголовки для requests
+# Заголовки для всех запросов сессии
 COMMON_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:142.0) Gecko/20100101 Firefox/142.0",
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
     "Accept-Language": "ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3",
-    "Accept-Encoding": "gzip, deflate, br, zstd",
     "Connection": "keep-alive",
     "Referer": "https://www.google.com/",
     "Upgrade-Insecure-Requests": "1",
@@ -50,167 +66,226 @@ COMMON_HEADERS = {
     "Sec-Fetch-Site": "cross-site",
 }
 
+# Accept-Encoding выставляет http_fetch — только то, что умеем распаковать
+
 # Опционально можно добавить cookies
 COOKIES = {}
 
-# Таймауты и паузы
+# Таймауты, темп и повторы (вместо фиксированных пауз — ratelimit.py и resilience.py)
 REQUEST_TIMEOUT = 12
-SLEEP_BETWEEN_REQUESTS = 0.8
-MAX_RETRIES = 2
-RETRY_BACKOFF = 1.5
-
-# --- Регулярки для цен ---
-money_re = re.compile(
-    r"(?:\d{1,3}(?:[ \u00A0]?\d{3})*(?:[.,]\d+)?)[ \u00A0]*[₽р]"
-    r"|(?:\d+[.,]?\d*)\s*(?:руб\.?|р\.?)",
-    re.I,
-)
-digits_re = re.compile(r"[\d \u00A0]+[,\.]?\d*")
-
-def extract_price_from_text(text: str) -> Optional[str]:
-    """Попытаться найти цену в тексте (первое соответствие)."""
-    if not text:
-        return None
-    m = money_re.search(text)
-    if m:
-        return m.group(0).strip()
-    m2 = re.search(r"(\d[\d \u00A0,\.]*?)\s*(руб|руб\.)", text, re.I)
-    if m2:
-        return f"{m2.group(1).strip()} руб."
-    m3 = digits_re.search(text)
-    if m3:
-        return m3.group(0).strip()
-    return None
-
-def safe_get(session: requests.Session, url: str, params=None, headers=None, allow_redirects=True) -> Optional[requests.Response]:
-    """GET с ретраями и обработкой ошибок."""
-    tries = 0
-    while tries <= MAX_RETRIES:
-        try:
-            r = session.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT, allow_redirects=allow_redirects)
-            r.raise_for_status()
+MAX_CONCURRENT_REQUESTS = 20  # общий предел параллельных запросов
+HOST_LIMITS = dict(rate=1.0, min_rate=0.2, max_rate=5.0, limit=2, max_limit=4)  # на хост
+RETRY = dict(attempts=3, base_delay=1.0, max_delay=8.0, failure_threshold=5, reset_timeout=60.0)
+PARSE_PROCESSES = None        # процессов разбора HTML: None — по числу ядер, 0 — без пула
+TEMPLATES_FILE = "site_templates.json"  # какой шаблон URL поиска сработал у сайта
+DEAD_STATUSES = (404, 410)    # такого пути поиска у сайта нет
+
+# --- Шаблоны поиска и разметка выдачи ---
+# (шаблоны URL с {q}, CSS карточек, запасной CSS, цена — из родителя карточки)
+CITILINK = (["https://www.citilink.ru/search/?text={q}"],
+            "a.ProductCardHorizontal__title, a.ProductCardVertical__title, a.ProductCard__title, a.product-card__name",
+            "a[href]", True)
+KARTRIDGMSK = (["https://kartridgmsk.ru/?s={q}",
+                "https://kartridgmsk.ru/?search={q}",
+                "https://kartridgmsk.ru/catalog/?q={q}",
+                "https://kartridgmsk.ru/index.php?route=product/search&filter_name={q}"],
+               "div.product, div.item, div.catalog-item, li.product, a.product-name",
+               "a[href]", True)
+GENERIC_PATHS = ["/search/?q={q}", "/search/?text={q}", "/search/?s={q}", "/?s={q}"]
+GENERIC_CSS = "div.product, div.item, li.product, div.catalog-item, div.card, article"
+
+# Кэш валидаторов, лимитеры, пул и память шаблонов создаёт init_resources() из main(),
+# а не импорт: процессы разбора (spawn) заново импортируют этот файл как __mp_main__,
+# и открывать в каждом из них базы и строить лимитеры незачем.
+sem: asyncio.Semaphore
+validators: ValidatorStore  # ETag / Last-Modified для условных запросов между прогонами
+limiter: AsyncRateLimiter
+conn_stats: ConnectionStats
+retry: RetryPolicy
+parse_pool: ParsePool
+
+
+class TemplateMemory:
+    """
+    Сработавший шаблон URL поиска по каждому сайту (JSON между прогонами).
+
+    good[site] — шаблон, по которому у сайта уже находился товар;
+    dead[site] — шаблоны, на которые сайт ответил 404/410.
+    Пока шаблон не известен, запросы к сайту идут по одному (lock):
+    первый пробует кандидатов, следующие пользуются его результатом.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.good: Dict[str, str] = {}
+        self.dead: Dict[str, List[str]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.probes = 0   # запросов, перебиравших кандидатов
+        self.direct = 0   # запросов сразу по известному шаблону
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.good = data.get("good", {})
+            self.dead = data.get("dead", {})
+
+    def lock(self, site: str) -> asyncio.Lock:
+        return self._locks.setdefault(site, asyncio.Lock())
+
+    def known(self, site: str, templates: Sequence[str]) -> Optional[str]:
+        tpl = self.good.get(site)
+        return tpl if tpl in templates else None
+
+    def candidates(self, site: str, templates: Sequence[str]) -> List[str]:
+        dead = self.dead.get(site, [])
+        return [tpl for tpl in templates if tpl not in dead]
+
+    def remember(self, site: str, template: str):
+        self.good[site] = template
+
+    def mark_dead(self, site: str, template: str):
+        if self.good.get(site) == template:
+            del self.good[site]
+        dead = self.dead.setdefault(site, [])
+        if template not in dead:
+            dead.append(template)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"good": self.good, "dead": self.dead}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> str:
+        return (f"Шаблоны поиска: известно для {len(self.good)} сайтов, "
+                f"перебор кандидатов {self.probes} раз, сразу по шаблону {self.direct} раз")
+
+
+templates: TemplateMemory
+
+
+def init_resources():
+    global sem, validators, limiter, conn_stats, retry, parse_pool, templates
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    validators = ValidatorStore("http_cache.db")
+    limiter = AsyncRateLimiter(**HOST_LIMITS)
+    conn_stats = ConnectionStats()
+    retry = RetryPolicy(**RETRY)
+    parse_pool = ParsePool(PARSE_PROCESSES)
+    templates = TemplateMemory(TEMPLATES_FILE)
+
+
+async def fetch(session, site_name: str, url: str) -> Optional[Fetched]:
+    """GET с повторами и выключателем на сайт (условный запрос + распаковка — в http_fetch)."""
+
+    async def attempt():
+        async with limiter.slot(url) as slot, sem:
+            r = await fetch_async(session, url, validators, timeout=REQUEST_TIMEOUT)
+            slot.record(r.status_code, r.headers.get("Retry-After"))
             return r
-        except requests.HTTPError as e:
-            print(f"[HTTP ERR] {url} → {e} (status: {getattr(e.response, 'status_code', None)})")
-            if 500 <= getattr(e.response, "status_code", 0) < 600 and tries < MAX_RETRIES:
-                tries += 1
-                time.sleep(RETRY_BACKOFF ** tries)
-                continue
-            return None
-        except requests.RequestException as e:
-            print(f"[REQ ERR] {url} → {e}")
-            tries += 1
-            time.sleep(RETRY_BACKOFF ** tries)
-    return None
-
-# --- Сайт-специфичные парсеры ---
-def parse_citilink(session: requests.Session, query: str) -> Optional[Tuple[str, str]]:
-    base = "https://www.citilink.ru/search/"
-    params = {"text": query}
-    r = safe_get(session, base, params=params, headers=COMMON_HEADERS)
-    if not r:
+
+    try:
+        r = await retry.run(site_name, attempt, retry_if=lambda r: r.status_code in RETRYABLE_STATUSES)
+    except Exception as e:  # в т.ч. CircuitOpenError — сайт лежит, таймаут не ждём
+        print(f"[REQ ERR] {url} → {e!r}")
         return None
-    soup = BeautifulSoup(r.text, "html.parser")
-    candidates = soup.select("a.ProductCardHorizontal__title, a.ProductCardVertical__title, a.ProductCard__title, a.product-card__name")
-    if not candidates:
-        candidates = soup.find_all("a", href=True)
-    qlow = query.lower()
-    for a in candidates:
-        title = a.get_text(" ", strip=True)
-        if title and qlow in title.lower():
-            parent = a.find_parent()
-            price = extract_price_from_text(parent.get_text(" ", strip=True)) if parent else None
-            if not price:
-                price = extract_price_from_text(soup.get_text(" ", strip=True))
-            return (title, price or "Цена не найдена")
-    return None
-
-def parse_kartridgmsk(session: requests.Session, query: str) -> Optional[Tuple[str, str]]:
-    qenc = urllib.parse.quote_plus(query)
-    tried_urls = [
-        f"https://kartridgmsk.ru/?s={qenc}",
-        f"https://kartridgmsk.ru/?search={qenc}",
-        f"https://kartridgmsk.ru/catalog/?q={qenc}",
-        f"https://kartridgmsk.ru/index.php?route=product/search&filter_name={qenc}",
-    ]
-    for url in tried_urls:
-        r = safe_get(session, url, headers=COMMON_HEADERS)
-        if not r:
-            continue
-        soup = BeautifulSoup(r.text, "html.parser")
-        items = soup.select("div.product, div.item, div.catalog-item, li.product, a.product-name")
-        if not items:
-            items = soup.find_all("a", href=True)
-        qlow = query.lower()
-        for it in items:
-            title = it.get_text(" ", strip=True)
-            if title and qlow in title.lower():
-                parent = it.find_parent()
-                price = extract_price_from_text(parent.get_text(" ", strip=True)) if parent else None
-                if not price:
-                    price = extract_price_from_text(soup.get_text(" ", strip=True))
-                return (title, price or "Цена не найдена")
-        time.sleep(0.25)
-    return None
-
-def parse_generic_html(session: requests.Session, site: dict, query: str) -> Optional[Tuple[str, str]]:
-    base = site["url"].rstrip("/")
-    candidates_urls = [
-        f"{base}/search/?q={urllib.parse.quote_plus(query)}",
-        f"{base}/search/?text={urllib.parse.quote_plus(query)}",
-        f"{base}/search/?s={urllib.parse.quote_plus(query)}",
-        f"{base}/?s={urllib.parse.quote_plus(query)}",
-    ]
-    for url in candidates_urls:
-        r = safe_get(session, url, headers=COMMON_HEADERS)
-        if not r:
-            continue
-        soup = BeautifulSoup(r.text, "html.parser")
-        elems = soup.select("div.product, div.item, li.product, div.catalog-item, div.card, article")
-        if not elems:
-            elems = soup.find_all(["a", "div", "li"])
-        qlow = query.lower()
-        for e in elems:
-            title = e.get_text(" ", strip=True)
-            if title and qlow in title.lower():
-                price = extract_price_from_text(e.get_text(" ", strip=True)) or extract_price_from_text(soup.get_text(" ", strip=True))
-                return (title.strip(), price or "Цена не найдена")
-        time.sleep(0.2)
-    return None
+    if r.status_code >= 400:
+        print(f"[HTTP ERR] {url} → (status: {r.status_code})")
+    return r
 
 # --- Router для сайтов ---
-def search_site(session: requests.Session, site: dict, query: str) -> Optional[Tuple[str, str]]:
-    try:
-        if "citilink" in site["url"]:
-            return parse_citilink(session, query)
-        if "kartridgmsk" in site["url"]:
-            return parse_kartridgmsk(session, query)
-        return parse_generic_html(session, site, query)
-    except Exception as e:
-        print(f"[PARSE ERR] {site.get('name')} → {e}")
+def site_profile(site: dict) -> Tuple[List[str], str, str, bool]:
+    if "citilink" in site["url"]:
+        return CITILINK
+    if "kartridgmsk" in site["url"]:
+        return KARTRIDGMSK
+    base = site["url"].rstrip("/")
+    return [base + path for path in GENERIC_PATHS], GENERIC_CSS, "a, div, li", False
+
+
+async def probe(session, site: dict, template: str, query: str) -> Optional[Tuple[str, str]]:
+    """Один шаблон URL поиска; 404/410 помечает шаблон как несуществующий."""
+    _, item_css, fallback_css, price_from_parent = site_profile(site)
+    url = template.format(q=urllib.parse.quote_plus(query))
+    r = await fetch(session, site["name"], url)
+    if r is None:
+        return None
+    if r.status_code in DEAD_STATUSES:
+        templates.mark_dead(site["name"], template)
+    if r.status_code != 200:
         return None
+    return await parse_pool.run(extract_match, r.text, query, item_css, fallback_css, price_from_parent)
+
+
+async def search_site(session, site: dict, query: str) -> Optional[Tuple[str, str]]:
+    name = site["name"]
+    all_templates = site_profile(site)[0]
+
+    tpl = templates.known(name, all_templates)
+    if tpl:
+        templates.direct += 1
+        res = await probe(session, site, tpl, query)
+        if res or templates.known(name, all_templates):
+            return res
+        # шаблон перестал существовать (404) — перебираем кандидатов заново
+
+    async with templates.lock(name):
+        tpl = templates.known(name, all_templates)
+        if tpl:  # пока ждали, шаблон нашёл другой запрос
+            templates.direct += 1
+            return await probe(session, site, tpl, query)
+
+        templates.probes += 1
+        jobs = [(tpl, lambda tpl=tpl: probe(session, site, tpl, query))
+                for tpl in templates.candidates(name, all_templates)]
+        hits = await race_sites(jobs, mode="ordered",
+                                on_error=lambda tpl, e: print(f"[PARSE ERR] {name} → {e}"))
+        if not hits:
+            return None
+        tpl, res = hits[0]
+        templates.remember(name, tpl)
+        return res
+
+
+async def search_all(session, query: str) -> List[Tuple[str, Optional[Tuple[str, str]]]]:
+    """Все сайты по одному запросу одновременно; результаты — в порядке SITES."""
+
+    async def one(site):
+        try:
+            return await search_site(session, site, query)
+        except Exception as e:
+            print(f"[PARSE ERR] {site.get('name')} → {e}")
+            return None
+
+    results = await asyncio.gather(*(one(site) for site in SITES))
+    return [(site.get("name") or site.get("url"), res) for site, res in zip(SITES, results)]
 
 # --- Main ---
-def main():
-    session = requests.Session()
-    session.headers.update(COMMON_HEADERS)
-    if COOKIES:
-        session.cookies.update(COOKIES)
+async def main():
+    init_resources()
+    with parse_pool:
+        async with create_session(COMMON_HEADERS, stats=conn_stats) as session:
+            if COOKIES:
+                session.cookie_jar.update_cookies(COOKIES)
+            # запросы тоже параллельно: ограничивают только хосты (limiter) и sem
+            per_query = await asyncio.gather(*(search_all(session, q) for q in QUERIES))
 
-    for query in QUERIES:
+    for query, results in zip(QUERIES, per_query):
         print(f"\n=== Поиск: {query} ===")
-        for site in SITES:
-            name = site.get("name") or site.get("url")
-            try:
-                res = search_site(session, site, query)
-                if res:
-                    title, price = res
-                    print(f"[{name}] → ({title}) : {price}")
-                else:
-                    print(f"[{name}] → не найдено")
-            except Exception as e:
-                print(f"[{name}] → Ошибка: {e}")
-            time.sleep(SLEEP_BETWEEN_REQUESTS)
+        for name, res in results:
+            if res:
+                title, price = res
+                print(f"[{name}] → ({title}) : {price}")
+            else:
+                print(f"[{name}] → не найдено")
+
+    templates.save()
+    print(f"\n{templates.stats()}")
+    print(limiter.stats())
+    print(retry.stats())
+    print(conn_stats.report())
+    print(parse_pool.stats())
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
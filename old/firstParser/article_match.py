@@ -0,0 +1,114 @@
+"""
+article_match.py
+
+Поиск сразу всех артикулов позиции на странице и привязка к ближайшей цене.
+
+В строках source.csv бывает до 20 взаимозаменяемых артикулов
+(C8531/RG5-6212/...). Искать каждый отдельно — это 20 проходов по тексту
+страницы и 20 обходов DOM. Здесь артикулы собираются в префиксное дерево
+и превращаются в одно регулярное выражение (trie-regex): в каждой позиции
+текста движок идёт только по совпадающим веткам дерева, как автомат
+Ахо–Корасик, поэтому стоимость растёт с размером страницы, а не
+с произведением размера на число артикулов.
+
+    matcher = ArticleMatcher(["C8531", "RG5-6212"])
+    matcher.find(text)                 → {артикул: [(начало, конец), ...]}
+    matcher.nearest_prices(text, 500)  → {артикул: Price}  — ближайшая цена по смещению
+    matcher.nodes(doc)                 → {артикул: [элемент, ...]} — один обход DOM
+
+Регистр не учитывается (re.IGNORECASE), поэтому текст не нужно
+приводить к нижнему регистру, а смещения совпадают с исходным текстом.
+Если один артикул — начало другого (RG5-6212 и RG5-6212-000), совпадение
+с длинным засчитывается обоим.
+"""
+
+import bisect
+import re
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+import html_extract as hx
+from prices import Price, iter_prices
+
+
+def _trie_regex(node: dict) -> str:
+    branches = [re.escape(ch) + _trie_regex(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ""
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")" + ("?" if "" in node else "")
+
+
+def build_pattern(words: Iterable[str]) -> Optional[Pattern]:
+    """Одно выражение для всех слов; длинное слово предпочтительнее своего префикса."""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    if not trie:
+        return None
+    return re.compile(_trie_regex(trie), re.IGNORECASE)
+
+
+class ArticleMatcher:
+    def __init__(self, articles: Iterable[str]):
+        # порядок важен: первый артикул в строке — основной
+        self.articles: List[str] = []
+        for art in articles:
+            art = (art or "").strip().lower()
+            if art and art not in self.articles:
+                self.articles.append(art)
+        self._known = set(self.articles)
+        self.pattern = build_pattern(self.articles)
+
+    def __bool__(self):
+        return self.pattern is not None
+
+    def _owners(self, matched: str) -> List[str]:
+        """Артикулы, которым засчитывается совпадение: само слово и его префиксы-артикулы."""
+        matched = matched.lower()
+        return [matched[:i] for i in range(1, len(matched) + 1) if matched[:i] in self._known]
+
+    def find(self, text: str) -> Dict[str, List[Tuple[int, int]]]:
+        found: Dict[str, List[Tuple[int, int]]] = {}
+        if not self or not text:
+            return found
+        for m in self.pattern.finditer(text):
+            for art in self._owners(m.group(0)):
+                found.setdefault(art, []).append((m.start(), m.start() + len(art)))
+        return found
+
+    def nearest_prices(self, text: str, window: int = 500) -> Dict[str, Price]:
+        """Для каждого найденного артикула — ближайшая цена с валютой не дальше window символов."""
+        spans = self.find(text)
+        if not spans:
+            return {}
+        tokens = list(iter_prices(text, bare=False))
+        starts = [start for start, _, _ in tokens]
+        result: Dict[str, Price] = {}
+        for art, occurrences in spans.items():
+            best: Optional[Tuple[int, Price]] = None
+            for a_start, a_end in occurrences:
+                i = bisect.bisect_left(starts, a_end)
+                # ближайшая цена справа от артикула и ближайшая слева/поверх него
+                for j in (i, i - 1):
+                    if 0 <= j < len(tokens):
+                        p_start, p_end, price = tokens[j]
+                        dist = p_start - a_end if p_start >= a_end else max(0, a_start - p_end)
+                        if dist <= window and (best is None or dist < best[0]):
+                            best = (dist, price)
+            if best:
+                result[art] = best[1]
+        return result
+
+    def nodes(self, doc) -> Dict[str, List]:
+        """Элементы, в строках которых встречается артикул, — за один обход дерева."""
+        found: Dict[str, List] = {}
+        if not self:
+            return found
+        for parent, string in hx.matching(doc, self.pattern):
+            for art in dict.fromkeys(a for m in self.pattern.finditer(string) for a in self._owners(m.group(0))):
+                found.setdefault(art, []).append(parent)
+        return found
@@ -12,67 +12,111 @@ price_scraper_async.py
 - zipzip.ru
 
 Особенности:
-- Использует aiohttp + asyncio для параллельных запросов.
+- Использует aiohttp + asyncio для параллельных запросов (пул соединений — http_session.py).
 - Ограничивает одновременные запросы (Semaphore).
-- Кэширует результаты по позициям.
-- Сохраняет промежуточные результаты каждые N записей.
+- Повторяет сбои с джиттером и не ждёт лежащие сайты (resilience.py).
+- Опрашивает все сайты по позиции одновременно (см. fanout.py).
+- Кэширует результаты по позициям, а ответы сайтов — на диске (lookup_cache.py).
+- Разбирает HTML в пуле процессов, не блокируя event loop (parse_pool.py, extractors.py).
+- Ищет один раз на группу строк с одним артикулом (query_plan.py).
+- Дописывает результаты в журнал (results_sink.py) и продолжает с места остановки.
+- По желанию загружает прогон в PostgreSQL одним COPY (pg_store.py, PG_DSN).
 """
 
 import sys
-import csv
-import re
 import asyncio
 import aiohttp
 import urllib.parse
 from typing import Optional, Tuple, List, Dict
 
+from fanout import race_sites
+from results_sink import ResultSink
+from lookup_cache import LookupCache
+from http_fetch import ValidatorStore, fetch_async
+from http_session import ConnectionStats, create_session
+from ratelimit import AsyncRateLimiter, host_of
+from resilience import RetryPolicy, RETRYABLE_STATUSES
+from parse_pool import ParsePool
+from extractors import extract_offer
+import source_grammar
+from query_plan import QueryPlan
+
 # ----------------- Конфигурация ---------------------
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
                   " (KHTML, like Gecko) Chrome/115.0 Safari/537.36"
 }
 REQUEST_TIMEOUT = 10
-MAX_CONCURRENT_REQUESTS = 10  # ограничение параллельных запросов
-SAVE_EVERY = 500              # каждые N результатов сохранять промежуточный CSV
-
-SITES = ["chipdip", "laserparts", "tze1", "zipzip"]
+MAX_CONCURRENT_REQUESTS = 10  # общий предел параллельных запросов
+HOST_LIMITS = dict(rate=2.0, max_rate=10.0, limit=2, max_limit=8)  # старт/потолок на хост, см. ratelimit.py
+RETRY = dict(attempts=3, base_delay=0.5, max_delay=8.0,   # повторы и выключатели на сайт, см. resilience.py
+             failure_threshold=5, reset_timeout=30.0)
+PARSE_PROCESSES = None        # процессов разбора HTML: None — по числу ядер, 0 — без пула
+SAVE_EVERY = 500              # контрольная точка журнала каждые N результатов...
+CHECKPOINT_SECONDS = 30       # ...или каждые T секунд
+RESULTS_DIR = "results"       # прогоны в Parquet (results_store.py); None — только CSV
+PG_DSN = None                 # история цен в PostgreSQL (pg_store.py), напр. pg_store.DSN; None — не писать
+
+CACHE_DB = "lookup_cache.db"   # постоянный кэш ответов сайтов
+HTTP_CACHE_DB = "http_cache.db"  # ETag / Last-Modified для условных запросов
+CACHE_TTL = {                  # срок жизни записи по сайту, сек
+    "chipdip": 3 * 24 * 3600,
+    "laserparts": 7 * 24 * 3600,
+    "tze1": 7 * 24 * 3600,
+    "zipzip": 7 * 24 * 3600,
+}
 
-PRICE_RE = re.compile(r"(\d[\d\s]*[,\.]?\d*)\s*(?:руб\.?|₽|RUB)", re.I)
-NUM_RE = re.compile(r"(\d[\d\s]*[,\.]?\d*)")
+SITES = ["chipdip", "laserparts", "tze1", "zipzip"]  # порядок = приоритет
+SEARCH_MODE = "ordered"       # "first" | "ordered" — см. fanout.py
 
 CACHE: Dict[str, Tuple[Optional[float], Optional[str], Optional[str]]] = {}
 
-sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+# Кэши, лимитеры и пул создаёт init_resources() из process_items, а не импорт:
+# процессы разбора (spawn) заново импортируют этот файл как __mp_main__,
+# и открывать в каждом из них базы и строить лимитеры незачем.
+sem: asyncio.Semaphore
+lookup_cache: LookupCache
+validators: ValidatorStore
+limiter: AsyncRateLimiter
+conn_stats: ConnectionStats
+retry: RetryPolicy
+parse_pool: ParsePool
+
+def init_resources():
+    global sem, lookup_cache, validators, limiter, conn_stats, retry, parse_pool
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    lookup_cache = LookupCache(CACHE_DB, ttl=CACHE_TTL)
+    validators = ValidatorStore(HTTP_CACHE_DB)
+    limiter = AsyncRateLimiter(**HOST_LIMITS)
+    conn_stats = ConnectionStats()
+    retry = RetryPolicy(**RETRY)
+    parse_pool = ParsePool(PARSE_PROCESSES)
 
-# ----------------- Парсинг цены ---------------------
+# ----------------- Запросы --------------------------
 
-def parse_price_from_text(text: str) -> Optional[float]:
-    if not text:
-        return None
-    m = PRICE_RE.search(text)
-    if m:
-        raw = m.group(1)
-    else:
-        m2 = NUM_RE.search(text)
-        if not m2:
-            return None
-        raw = m2.group(1)
-    cleaned = raw.replace(' ', '').replace('\xa0', '').replace(',', '.')
-    try:
-        return float(cleaned)
-    except Exception:
-        return None
+async def fetch(session: aiohttp.ClientSession, url: str,
+                cache_key: Optional[Tuple[str, str]] = None) -> Optional[str]:
+    """cache_key=(site, query) — брать ответ из постоянного кэша и класть в него."""
+    if cache_key:
+        body = lookup_cache.get(*cache_key)
+        if body is not None:
+            return body
 
-# ----------------- Запросы --------------------------
+    async def attempt():
+        async with limiter.slot(url) as slot, sem:
+            resp = await fetch_async(session, url, validators, timeout=REQUEST_TIMEOUT)
+            slot.record(resp.status_code, resp.headers.get("Retry-After"))
+            return resp
 
-async def fetch(session: aiohttp.ClientSession, url: str) -> Optional[str]:
     try:
-        async with sem:
-            async with session.get(url, timeout=REQUEST_TIMEOUT) as resp:
-                if resp.status == 200:
-                    return await resp.text()
-    except Exception:
+        resp = await retry.run(cache_key[0] if cache_key else host_of(url), attempt,
+                               retry_if=lambda r: r.status_code in RETRYABLE_STATUSES)
+    except Exception:  # в т.ч. CircuitOpenError — сайт лежит, таймаут не ждём
         return None
+    if resp.status_code == 200:
+        if cache_key:
+            lookup_cache.put(*cache_key, resp.text)
+        return resp.text
     return None
 
 # ----------------- Парсеры сайтов -------------------
@@ -80,70 +124,38 @@ async def fetch(session: aiohttp.ClientSession, url: str) -> Optional[str]:
 async def search_chipdip(session, query: str):
     q = urllib.parse.quote_plus(query)
     url = f"https://www.chipdip.ru/search/?q={q}"
-    html = await fetch(session, url)
+    html = await fetch(session, url, cache_key=('chipdip', query))
     if not html:
         return None, None
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(html, 'html.parser')
-    item = soup.select_one('.catalog-item, .product-card, .search-result__item')
-    if not item:
-        price = parse_price_from_text(soup.get_text(' ', strip=True))
-        return price, url if price else (None, None)
-    price = parse_price_from_text(item.get_text(' ', strip=True))
-    link = item.select_one('a')
-    href = urllib.parse.urljoin('https://www.chipdip.ru', link.get('href')) if link and link.get('href') else url
-    return price, href if price else (None, href)
+    return await parse_pool.run(extract_offer, html, url, 'https://www.chipdip.ru',
+                                '.catalog-item, .product-card, .search-result__item')
 
 async def search_laserparts(session, query: str):
     q = urllib.parse.quote_plus(query)
     url = f"https://laserparts.ru/search/?q={q}"
-    html = await fetch(session, url)
+    html = await fetch(session, url, cache_key=('laserparts', query))
     if not html:
         return None, None
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(html, 'html.parser')
-    item = soup.select_one('.product-card, .catalog-item, .product')
-    if item:
-        price = parse_price_from_text(item.get_text(' ', strip=True))
-        link = item.select_one('a')
-        href = urllib.parse.urljoin('https://laserparts.ru', link.get('href')) if link and link.get('href') else url
-        return price, href if price else (None, href)
-    price = parse_price_from_text(soup.get_text(' ', strip=True))
-    return price, url if price else (None, None)
+    return await parse_pool.run(extract_offer, html, url, 'https://laserparts.ru',
+                                '.product-card, .catalog-item, .product')
 
 async def search_tze1(session, query: str):
     q = urllib.parse.quote_plus(query)
     url = f"https://tze1.ru/?s={q}"
-    html = await fetch(session, url)
+    html = await fetch(session, url, cache_key=('tze1', query))
     if not html:
         return None, None
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(html, 'html.parser')
-    item = soup.select_one('.product, .item, .search-result')
-    if item:
-        price = parse_price_from_text(item.get_text(' ', strip=True))
-        link = item.select_one('a')
-        href = urllib.parse.urljoin('https://tze1.ru', link.get('href')) if link and link.get('href') else url
-        return price, href if price else (None, href)
-    price = parse_price_from_text(soup.get_text(' ', strip=True))
-    return price, url if price else (None, None)
+    return await parse_pool.run(extract_offer, html, url, 'https://tze1.ru',
+                                '.product, .item, .search-result')
 
 async def search_zipzip(session, query: str):
     q = urllib.parse.quote_plus(query)
     url = f"https://zipzip.ru/search/?q={q}"
-    html = await fetch(session, url)
+    html = await fetch(session, url, cache_key=('zipzip', query))
     if not html:
         return None, None
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(html, 'html.parser')
-    item = soup.select_one('.product, .catalog-item, .product-card')
-    if item:
-        price = parse_price_from_text(item.get_text(' ', strip=True))
-        link = item.select_one('a')
-        href = urllib.parse.urljoin('https://zipzip.ru', link.get('href')) if link and link.get('href') else url
-        return price, href if price else (None, href)
-    price = parse_price_from_text(soup.get_text(' ', strip=True))
-    return price, url if price else (None, None)
+    return await parse_pool.run(extract_offer, html, url, 'https://zipzip.ru',
+                                '.product, .catalog-item, .product-card')
 
 SEARCH_FUNCS = {
     'chipdip': search_chipdip,
@@ -154,53 +166,83 @@ SEARCH_FUNCS = {
 
 # ----------------- Основная логика ------------------
 
-async def find_price_for_item(session, item: str):
+def _site_jobs(session, item: str):
+    return [(site, lambda f=SEARCH_FUNCS[site]: f(session, item)) for site in SITES]
+
+def _skip_site(item: str):
+    # выключатель открыт — сайт не опрашиваем, если ответа нет в кэше
+    return lambda site: retry.is_open(site) and lookup_cache.get(site, item) is None
+
+def _has_price(result) -> bool:
+    return bool(result) and result[0] is not None
+
+async def find_price_for_item(session, item: str, mode: str = SEARCH_MODE):
     if item in CACHE:
         return CACHE[item]
-    for site in SITES:
-        func = SEARCH_FUNCS[site]
-        try:
-            price, url = await func(session, item)
-        except Exception:
-            price, url = None, None
-        if price is not None:
-            result = (price, site, url)
-            CACHE[item] = result
-            return result
-    CACHE[item] = (None, None, None)
-    return None, None, None
+    hits = await race_sites(_site_jobs(session, item), accept=_has_price, mode=mode,
+                            skip=_skip_site(item))
+    if hits:
+        site, (price, url) = hits[0]
+        result = (price, site, url)
+    else:
+        result = (None, None, None)
+    CACHE[item] = result
+    return result
+
+async def find_offers_for_item(session, item: str) -> List[Tuple[float, str, Optional[str]]]:
+    """Все найденные предложения по позиции в порядке приоритета сайтов."""
+    hits = await race_sites(_site_jobs(session, item), accept=_has_price, mode="all",
+                            skip=_skip_site(item))
+    return [(price, site, url) for site, (price, url) in hits]
 
 async def process_items(infile: str, outfile: str):
-    items = []
-    with open(infile, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if row:
-                items.append(row[0].strip())
-
-    results = []
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        for idx, item in enumerate(items, 1):
-            price, site, url = await find_price_for_item(session, item)
-            if price is None:
-                print(f"[{idx}/{len(items)}] {item} → не найдено")
-                results.append((item, '', '', ''))
-            else:
-                print(f"[{idx}/{len(items)}] {item} → {price:.2f} руб. ({site})")
-                results.append((item, f"{price:.2f}", site, url))
-
-            if idx % SAVE_EVERY == 0:
-                with open(outfile, 'w', newline='', encoding='utf-8') as csvf:
-                    writer = csv.writer(csvf)
-                    writer.writerow(['item', 'price_rub', 'source_site', 'source_url'])
-                    writer.writerows(results)
-                print(f"--- Сохранено промежуточно: {idx} строк")
-
-    with open(outfile, 'w', newline='', encoding='utf-8') as csvf:
-        writer = csv.writer(csvf)
-        writer.writerow(['item', 'price_rub', 'source_site', 'source_url'])
-        writer.writerows(results)
+    init_resources()
+    plan = QueryPlan(source_grammar.load(infile))
+    print(plan.report())
+
+    sink = ResultSink(outfile, ['item', 'price_rub', 'source_site', 'source_url'],
+                      checkpoint_rows=SAVE_EVERY, checkpoint_seconds=CHECKPOINT_SECONDS,
+                      store_dir=RESULTS_DIR)
+    if sink.rows:
+        print(f"Продолжаем: уже обработано {len(sink.done)} позиций")
+
+    pg_rows = []  # строки этого запуска для pg_store: грузятся одним COPY в конце
+    with sink, parse_pool:
+        async with create_session(HEADERS, stats=conn_stats) as session:
+            for idx, query in enumerate(plan.queries, 1):
+                lines = [line for line in plan.lines_for(query) if line not in sink.done]
+                if not lines:
+                    continue
+                price, site, url = await find_price_for_item(session, query)
+                if price is None:
+                    print(f"[{idx}/{len(plan.queries)}] {query} → не найдено ({len(lines)} стр.)")
+                    rows = [(line, '', '', '') for line in lines]
+                else:
+                    print(f"[{idx}/{len(plan.queries)}] {query} → {price:.2f} руб. ({site}, {len(lines)} стр.)")
+                    rows = [(line, f"{price:.2f}", site, url) for line in lines]
+
+                pg_rows.extend(rows)
+                for row in rows:
+                    if sink.append(row):
+                        print(f"--- Сохранено промежуточно: {sink.rows} строк")
+
+    if PG_DSN and pg_rows:
+        from pg_store import PgStore  # asyncpg нужен только с PG_DSN
+        async with PgStore(PG_DSN) as store:
+            run_id = await store.start_run("asyncMain")
+            await store.load_run(run_id, pg_rows)
+            await store.finish_run(run_id)
+        print(f"PostgreSQL: прогон {run_id}, {len(pg_rows)} строк")
+
+    print(f"Кэш ответов: {lookup_cache.stats()}")
+    print(f"HTTP: {validators.stats()}")
+    print(limiter.stats())
+    print(conn_stats.report())
+    print(retry.stats())
+    print(parse_pool.stats())
     print(f"Готово — результаты записаны в {outfile}")
+    if sink.run_path:
+        print(f"Прогон для анализа: {sink.run_path}")
 
 # ----------------- Точка входа ----------------------
 
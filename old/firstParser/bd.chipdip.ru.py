@@ -1,10 +1,12 @@
 import requests
 import sqlite3
+import time
 import pandas as pd
 import logging
-import time
-import random
-from bs4 import BeautifulSoup
+
+import html_extract as hx
+from prices import price_value
+from ratelimit import RateLimiter
 
 # --- ЛОГИ ---
 logging.basicConfig(
@@ -16,57 +18,139 @@ logging.basicConfig(
 
 # --- БД ---
 DB_PATH = "chipdip.db"
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
-cur.execute("""
-CREATE TABLE IF NOT EXISTS queries (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT UNIQUE
-)
-""")
-cur.execute("""
-CREATE TABLE IF NOT EXISTS results (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    query TEXT,
-    product_name TEXT,
-    price TEXT,
-    url TEXT,
-    status TEXT
-)
-""")
-conn.commit()
+BATCH_ROWS = 200      # результаты пишутся пачкой в одной транзакции каждые N строк...
+BATCH_SECONDS = 10    # ...или каждые T секунд, смотря что раньше
+
+
+class ResultsDB:
+    """
+    SQLite с WAL и пакетной записью.
+
+    Раньше каждый INSERT шёл отдельной транзакцией с commit — один fsync
+    на позицию. Здесь результаты копятся в буфере и уходят одним
+    executemany в одной транзакции; WAL + synchronous=NORMAL не делают
+    fsync на каждый commit. Цена хранится и как текст со страницы (price),
+    и числом (price_rub REAL). При повторном запуске pending_queries()
+    возвращает только позиции без результата (ошибки запрашиваются заново).
+    """
+
+    def __init__(self, path: str, batch_rows: int = BATCH_ROWS, batch_seconds: float = BATCH_SECONDS):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self.flushes = 0
+        self.written = 0
+        with self.conn:
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS queries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE
+            )
+            """)
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT,
+                product_name TEXT,
+                price TEXT,
+                url TEXT,
+                status TEXT,
+                price_rub REAL
+            )
+            """)
+            self._migrate()
+            self.conn.execute("CREATE INDEX IF NOT EXISTS results_query ON results (query)")
+
+    def _migrate(self):
+        # базы до появления price_rub: добавляем колонку и заполняем её из текста цены
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(results)")]
+        if "price_rub" in columns:
+            return
+        self.conn.execute("ALTER TABLE results ADD COLUMN price_rub REAL")
+        rows = self.conn.execute("SELECT id, price FROM results WHERE price IS NOT NULL").fetchall()
+        self.conn.executemany("UPDATE results SET price_rub=? WHERE id=?",
+                              [(price_value(price), id_) for id_, price in rows])
+
+    def add_queries(self, names):
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO queries (name) VALUES (?)",
+                                  ((name,) for name in names if isinstance(name, str) and name))
+
+    def pending_queries(self):
+        """Позиции, для которых ещё нет результата (anti-join по индексу results_query)."""
+        return [row[0] for row in self.conn.execute("""
+            SELECT q.name FROM queries q
+            WHERE NOT EXISTS (
+                SELECT 1 FROM results r WHERE r.query = q.name AND r.status != 'error'
+            )
+            ORDER BY q.id
+        """)]
+
+    def add_result(self, query, name, price, url, status):
+        self._pending.append((query, name, price, url, status, price_value(price)))
+        if (len(self._pending) >= self.batch_rows
+                or time.monotonic() - self._last_flush >= self.batch_seconds):
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self.conn:
+                # прежние ошибки по этим позициям заменяются новым результатом
+                self.conn.executemany("DELETE FROM results WHERE query=? AND status='error'",
+                                      [(row[0],) for row in self._pending])
+                self.conn.executemany(
+                    "INSERT INTO results (query, product_name, price, url, status, price_rub)"
+                    " VALUES (?, ?, ?, ?, ?, ?)", self._pending)
+            self.written += len(self._pending)
+            self.flushes += 1
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def stats(self) -> str:
+        return f"записано {self.written} строк за {self.flushes} транзакций"
+
+
+db = ResultsDB(DB_PATH)
 
 # --- ЧТЕНИЕ CSV ---
 def load_csv_to_db(csv_file):
     df = pd.read_csv(csv_file)
-    for name in df.iloc[:, 0]:
-        try:
-            cur.execute("INSERT OR IGNORE INTO queries (name) VALUES (?)", (name,))
-        except Exception as e:
-            logging.error(f"Ошибка при вставке {name}: {e}")
-    conn.commit()
+    db.add_queries(df.iloc[:, 0])
 
 # --- ПАРСИНГ CHIPDIP ---
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:142.0) Gecko/20100101 Firefox/142.0"
 }
+SEARCH_URL = "https://www.chipdip.ru/search"
+
+# антибан: темп подстраивается под ответы chipdip (429/503 → сбавляем)
+limiter = RateLimiter(rate=0.5, min_rate=0.1, max_rate=2.0, rate_step=0.1)
 
 def chipdip_search(query):
     try:
-        url = "https://www.chipdip.ru/search"
-        r = requests.get(url, params={"searchtext": query}, headers=HEADERS, timeout=15)
+        with limiter.slot(SEARCH_URL) as slot:
+            r = requests.get(SEARCH_URL, params={"searchtext": query}, headers=HEADERS, timeout=15)
+            slot.record(r.status_code, r.headers.get("Retry-After"))
         r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
+        doc = hx.parse(r.text)
 
-        item = soup.select_one(".with-hover a")
-        price_block = soup.select_one(".price .price_value")
+        item = hx.select_one(doc, ".with-hover a")
+        price_block = hx.select_one(doc, ".price .price_value")
 
-        if not item:
+        if item is None:  # у lxml-элемента без детей bool() ложен
             return None, None, None, "not_found"
         
-        name = item.get("title") or item.text.strip()
-        href = "https://www.chipdip.ru" + item.get("href")
-        price_text = price_block.get_text(strip=True) if price_block else "нет в наличии"
+        name = hx.attr(item, "title") or hx.text(item, "", strip=False).strip()
+        href = "https://www.chipdip.ru" + hx.attr(item, "href")
+        price_text = hx.text(price_block, "") if price_block is not None else "нет в наличии"
 
         return name, price_text, href, "ok"
 
@@ -77,21 +161,18 @@ def chipdip_search(query):
 
 # --- ОСНОВНОЙ ЦИКЛ ---
 def run_parser():
-    cur.execute("SELECT name FROM queries")
-    all_queries = [row[0] for row in cur.fetchall()]
+    # только позиции без результата: повторный запуск продолжает с места остановки
+    queries = db.pending_queries()
+    print(f"К обработке: {len(queries)} позиций")
 
-    for query in all_queries:
+    for query in queries:
         name, price, href, status = chipdip_search(query)
-        cur.execute(
-            "INSERT INTO results (query, product_name, price, url, status) VALUES (?, ?, ?, ?, ?)",
-            (query, name, price, href, status)
-        )
-        conn.commit()
-        time.sleep(random.uniform(1, 3))  # антибан
+        db.add_result(query, name, price, href, status)
+    db.flush()
 
 # --- ВЫГРУЗКА CSV ---
 def export_results():
-    df = pd.read_sql_query("SELECT * FROM results", conn)
+    df = pd.read_sql_query("SELECT * FROM results ORDER BY id", db.conn)
     df.to_csv("result.csv", index=False, encoding="utf-8-sig")
 
 # --- Запуск ---
@@ -99,5 +180,6 @@ if __name__ == "__main__":
     load_csv_to_db("source100.csv")  # твой файл
     run_parser()
     export_results()
-    conn.close()
+    print(f"БД: {db.stats()}")
+    db.close()
     print("Готово! Результаты в result.csv, ошибки в errors.log")
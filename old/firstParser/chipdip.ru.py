@@ -5,6 +5,10 @@
 Боевой парсер для chipdip.ru (search -> product pages -> parse)
 Функции:
  - rate-limited запросы с retry/backoff
+ - строки выдачи (название, артикул, цена, наличие, ссылка) берутся прямо со страницы
+   поиска за один проход; карточка товара запрашивается только для строк без цены
+ - карточки товара грузятся пулом потоков (MAX_WORKERS) не глубже MAX_CARDS ссылок;
+   как только карточка совпала с артикулами запроса, остальные не запрашиваются
  - рандомные User-Agent и ротация прокси из файла (если есть)
  - парсинг "a, b, c" по правилам (a: кол-во/характеристика, b: описание, c: список артикулов через '/')
  - сохранение результата в CSV
@@ -17,28 +21,39 @@
  - QUERIES: список поисковых строк (пример в коде)
 """
 
-import time
 import random
 import csv
 import re
 import logging
-from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, List, Optional
 from pathlib import Path
+from urllib.parse import urljoin
 
 import requests
-from bs4 import BeautifulSoup
 from requests.adapters import HTTPAdapter, Retry
 
+import html_extract as hx
+from article_match import ArticleMatcher
+from prices import price_raw
+from source_grammar import parse_line
+from http_fetch import Fetched, ValidatorStore, fetch_sync
+from ratelimit import RateLimiter
+
 # ---------- Настройки ----------
 OUTPUT_CSV = "chipdip_results.csv"
 PROXIES_FILE = "proxies.txt"   # optional: one proxy per line host:port or user:pass@host:port
-MAX_WORKERS = 3                # кол-во одновременных потоков (если используешь async, но здесь синхронно)
-MIN_DELAY = 1.2                # минимальная пауза между запросами в секундах
-MAX_DELAY = 3.5                # максимальная пауза (рандом)
+MAX_WORKERS = 3                # карточек товара загружается одновременно (потоки)
+MAX_CARDS = 10                 # глубина: сколько ссылок со страницы поиска посещать; None — все
+STOP_ON_MATCH = True           # карточка совпала с артикулами запроса — остальные не грузим
+USE_LISTING = True             # цены из строк выдачи; карточки — только для строк без цены
+HOST_LIMITS = dict(rate=0.5, min_rate=0.1, max_rate=2.0, rate_step=0.1,  # запросов/с на хост,
+                   limit=2, max_limit=MAX_WORKERS)                       # и одновременно, см. ratelimit.py
 MAX_RETRIES = 4
 BACKOFF_FACTOR = 1.2
 TIMEOUT = 15                   # секунд
 LOG_LEVEL = logging.INFO
+HTTP_CACHE_DB = "http_cache.db"  # ETag / Last-Modified для условных запросов
 # -------------------------------
 
 logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(message)s")
@@ -66,6 +81,8 @@ def load_proxies(filename: str) -> List[str]:
     return out
 
 PROXIES = load_proxies(PROXIES_FILE)
+validators = ValidatorStore(HTTP_CACHE_DB)
+limiter = RateLimiter(**HOST_LIMITS)
 
 
 def build_session(proxy: Optional[str] = None) -> requests.Session:
@@ -93,25 +110,18 @@ def build_session(proxy: Optional[str] = None) -> requests.Session:
     return s
 
 
-def random_pause():
-    delay = random.uniform(MIN_DELAY, MAX_DELAY)
-    # jitter
-    jitter = random.uniform(0.0, 0.6)
-    total = delay + jitter
-    logger.debug(f"sleep {total:.2f}s")
-    time.sleep(total)
-
-
-def safe_get(session: requests.Session, url: str, params: dict = None, allow_redirects: bool = True) -> Optional[requests.Response]:
-    # обновляй User-Agent каждый раз
+def safe_get(session: requests.Session, url: str, params: dict = None, allow_redirects: bool = True) -> Optional[Fetched]:
+    # свой User-Agent на каждый запрос — заголовком запроса, а не сессии (сессию делят потоки)
     ua = random.choice(USER_AGENTS)
-    session.headers["User-Agent"] = ua
 
     # иногда стоит обновлять Referer случайным образом
     # session.headers["Referer"] = "https://www.chipdip.ru/"
 
     try:
-        resp = session.get(url, params=params, timeout=TIMEOUT, allow_redirects=allow_redirects)
+        with limiter.slot(url) as slot:
+            resp = fetch_sync(session, url, validators, params=params, headers={"User-Agent": ua},
+                              timeout=TIMEOUT, allow_redirects=allow_redirects)
+            slot.record(resp.status_code, resp.headers.get("Retry-After"))
         # Если сайт возвращает 403/401/429 — нужно обработать отдельно
         if resp.status_code == 403:
             logger.warning(f"403 Forbidden for {url}")
@@ -124,60 +134,20 @@ def safe_get(session: requests.Session, url: str, params: dict = None, allow_red
             return None
         # всё ок
         return resp
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         logger.warning(f"Request failed: {e} for {url}")
         return None
 
 
-# ---------- Парсинг названия + артикула (a,b,c) ----------
-# Возвращаем a, b, list[c]
-ARTICLE_PATTERN = re.compile(r"((?:[A-Za-zА-Яа-я0-9]+-[A-Za-zА-Яа-я0-9-]+[A-Za-zA-Яа-я0-9]*)|[A-Z0-9-]{4,})")
-# Паттерн списка артикулов в конце вида AAA-BBB-CCC/DDD-EEE
-ARTS_AT_END_RE = re.compile(r"((?:[A-Za-z0-9\-]+)(?:/(?:[A-Za-z0-9\-]+))+)$")
-# Для выделения a: число + слово(либо слово-часть), допустим "100-лист", "1шт", "2 шт."
-A_PART_RE = re.compile(r"^\s*([\d\w\-]+(?:[ \u00A0]?(?:шт|лист|pack|pcs|комп|шт\.)?)?)\.?\s*", re.IGNORECASE)
-
-def parse_a_b_c(text: str) -> Tuple[Optional[str], Optional[str], List[str]]:
-    if not text:
-        return None, None, []
-    t = text.strip()
-    # 1) Ищем список артикулов в конце
-    articles = []
-    m = ARTS_AT_END_RE.search(t)
-    if m:
-        arts_raw = m.group(1)
-        articles = [a.strip() for a in arts_raw.split("/") if a.strip()]
-        t = t[:m.start()].strip()
-
-    # 2) Ищем a (число/характеристика) в начале
-    a = None
-    b = None
-    ma = A_PART_RE.match(t)
-    if ma:
-        a = ma.group(1).strip().rstrip(".")
-        b = t[ma.end():].strip()
-    else:
-        # нет явного a — можно попытаться разбить на первые 1-2 слова
-        parts = t.split(None, 1)
-        a = parts[0] if parts else None
-        b = parts[1] if len(parts) > 1 else None
-
-    # Нормализация: убрать лишние точки и пробелы
-    if a:
-        a = re.sub(r"\s+", " ", a).strip().strip(".")
-    if b:
-        b = re.sub(r"\s+", " ", b).strip().strip(".")
-    return a, b, articles
-
 # ---------- Поиск ссылок на странице поиска ----------
 # Стараться отлавливать ссылки на карточки товара.
 POSSIBLE_PRODUCT_URL_RE = re.compile(r"^(?:/catalog/|/product/|/item/|/cards/|/product-card/|/product/\d+)", re.IGNORECASE)
 
 def find_product_links(html: str, base_url: str = "https://www.chipdip.ru") -> List[str]:
-    soup = BeautifulSoup(html, "html.parser")
-    links = set()
-    for a in soup.find_all("a", href=True):
-        href = a["href"].strip()
+    doc = hx.parse(html)
+    links = {}  # порядок как на странице: глубина MAX_CARDS берёт первые ссылки выдачи
+    for a in hx.select(doc, "a[href]"):
+        href = hx.attr(a, "href").strip()
         # нормализуем относительные ссылки
         if href.startswith("/"):
             full = base_url.rstrip("/") + href
@@ -188,15 +158,117 @@ def find_product_links(html: str, base_url: str = "https://www.chipdip.ru") -> L
 
         # простая эвристика: содержит шаблон product или /catalog/ или длинный path с артикулом
         if ("/catalog/" in href) or ("/product" in href) or (re.search(r"/card/|/item/|/product-card", href)):
-            links.add(full)
+            links[full] = None
         else:
             # fallback: если текст ссылки содержит слово "Купить" или "Подробнее"
-            txt = (a.get_text() or "").lower()
+            txt = hx.text(a, "", strip=False).lower()
             if "купить" in txt or "подробнее" in txt or "в корзину" in txt:
-                links.add(full)
+                links[full] = None
     return list(links)
 
 
+# ---------- Строки выдачи ----------
+# Разметка выдачи chipdip: строка товара, в ней ссылка-название, артикул, цена и наличие.
+LISTING_ROW_CSS = "tr.with-hover, .with-hover"
+LISTING_CSS = {
+    "name": "a.link, .name a, a[href]",
+    "article": ".itemlist_pn, .h_pn, .article",
+    "price": ".price .price_value, .price_value, .price",
+    "stock": ".item__avail, .avail, .nw",
+}
+CARD_PRICE_CSS = ".ordering__value, .price .price_value, .price_value, .price"
+CARD_STOCK_CSS = ".item__avail, .avail"
+
+
+def _first_text(node, css: str) -> str:
+    el = hx.select_one(node, css)
+    return hx.text(el) if el is not None else ""
+
+
+def make_record(query: str, url: str, title: Optional[str], price: Optional[str] = None,
+                stock: str = "", articles: Iterable[str] = (), source: str = "card") -> dict:
+    """Строка результата: название разбирается по правилам a, b, c (source_grammar)."""
+    rec = parse_line(title or "")
+    found = list(dict.fromkeys([*filter(None, articles), *rec.articles]))
+    return {
+        "query": query,
+        "product_url": url,
+        "title": title,
+        "a": rec.qty or None,
+        "b": " ".join(filter(None, [rec.description, rec.brand])) or None,
+        "articles": "|".join(found),
+        "price": price or "",
+        "stock": stock,
+        "source": source,
+    }
+
+
+def extract_listing(query: str, html: str, base_url: str = "https://www.chipdip.ru") -> List[dict]:
+    """Все строки выдачи за один проход: название, артикул, цена, наличие, ссылка."""
+    doc = hx.parse(html)
+    rows = {}
+    for row in hx.select(doc, LISTING_ROW_CSS):
+        link = hx.select_one(row, LISTING_CSS["name"])
+        href = hx.attr(link, "href") if link is not None else None
+        if not href:
+            continue
+        url = urljoin(base_url, href.strip())
+        if url in rows:
+            continue
+        title = hx.attr(link, "title") or hx.text(link)
+        price_el = hx.select_one(row, LISTING_CSS["price"])
+        price = price_raw(hx.text(price_el)) if price_el is not None else None
+        rows[url] = make_record(query, url, title, price,
+                                stock=_first_text(row, LISTING_CSS["stock"]),
+                                articles=[_first_text(row, LISTING_CSS["article"])],
+                                source="listing")
+    return list(rows.values())
+
+
+# ---------- Карточка товара ----------
+def fetch_card(session: requests.Session, query: str, link: str) -> Optional[dict]:
+    r = safe_get(session, link)
+    if not r or r.status_code != 200:
+        logger.warning(f"Skip link {link}")
+        return None
+    # парсим название карточки
+    doc = hx.parse(r.text)
+    # эвристика выбор названия: заголовки h1/h2, meta og:title, title
+    title = None
+    heading = hx.select_one(doc, "h1")
+    if heading is None:  # у lxml-элемента без детей bool() ложен
+        heading = hx.select_one(doc, "h2")
+    if heading is not None:
+        title = hx.text(heading, "")
+    if not title:
+        title = hx.attr(hx.select_one(doc, 'meta[property="og:title"]'), "content")
+    if not title:
+        title = hx.text(hx.select_one(doc, "title"), "", strip=False)
+
+    # дополнительные попытки найти артикулы в тексте страницы (таблицы характеристик)
+    articles = []
+    if not parse_line(title or "").articles:
+        # ищем patterns в тексте: типичные артикула (буквы-цифры с дефисами)
+        page_text = hx.text(doc)
+        # ищем все подходящие по длине/формату
+        found = re.findall(r"\b[A-Z0-9]{2,4}[-][A-Z0-9\-]{2,}\b", page_text, flags=re.IGNORECASE)
+        # фильтруем/уникализируем
+        found = [f for f in dict.fromkeys(found)]  # preserve order, unique
+        if found:
+            # можно выбрать первые N
+            articles = found[:6]
+
+    price = hx.attr(hx.select_one(doc, 'meta[itemprop="price"]'), "content")
+    price = price_raw(price) or price_raw(_first_text(doc, CARD_PRICE_CSS))
+    return make_record(query, link, title, price, stock=_first_text(doc, CARD_STOCK_CSS),
+                       articles=articles)
+
+
+def card_matches(matcher: ArticleMatcher, card: dict) -> bool:
+    """В названии или артикулах карточки есть артикул из запроса."""
+    return bool(matcher.find(f"{card['title'] or ''} {card['articles']}"))
+
+
 # ---------- Основная логика: поиск -> посещение карточек -> парсинг ----------
 def process_search(query: str, session: requests.Session, proxy: Optional[str] = None) -> List[dict]:
     results = []
@@ -209,55 +281,45 @@ def process_search(query: str, session: requests.Session, proxy: Optional[str] =
         logger.warning(f"No search results for '{query}' (status: {getattr(resp, 'status_code', None)})")
         return results
 
-    product_links = find_product_links(resp.text)
-    logger.info(f"Found {len(product_links)} product links (heuristic) for query '{query}'")
-    # ограничь глубину, если нужно
-    # product_links = product_links[:10]
-
-    for link in product_links:
-        # пауза перед запросом карточки
-        random_pause()
-        r = safe_get(session, link)
-        if not r or r.status_code != 200:
-            logger.warning(f"Skip link {link}")
+    matcher = ArticleMatcher(parse_line(query).articles)
+    listing = extract_listing(query, resp.text) if USE_LISTING else []
+    if listing:
+        # строки с ценой готовы без карточки; карточки — только для строк без цены
+        results = [row for row in listing if row["price"]]
+        product_links = [row["product_url"] for row in listing if not row["price"]]
+        logger.info(f"Listing: {len(listing)} rows, {len(product_links)} without price for query '{query}'")
+        if STOP_ON_MATCH and matcher and any(card_matches(matcher, row) for row in results):
+            return results
+    else:
+        product_links = find_product_links(resp.text)
+        logger.info(f"Found {len(product_links)} product links (heuristic) for query '{query}'")
+    # ограничиваем глубину
+    if MAX_CARDS is not None:
+        product_links = product_links[:MAX_CARDS]
+
+    # карточки грузятся параллельно (темп к хосту держит limiter); первое совпадение
+    # с артикулами запроса отменяет ещё не начатые загрузки
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {pool.submit(fetch_card, session, query, link): i for i, link in enumerate(product_links)}
+        for fut in as_completed(futures):
+            card = fut.result() if fut.exception() is None else None
+            if STOP_ON_MATCH and matcher and card and card_matches(matcher, card):
+                skipped = sum(f.cancel() for f in futures)
+                logger.info(f"Card {card['product_url']} matches '{query}', skipped {skipped} links")
+                break
+
+    # в порядке выдачи; загрузки, начатые до совпадения, тоже идут в результат
+    for fut, i in sorted(futures.items(), key=lambda kv: kv[1]):
+        if fut.cancelled():
             continue
-        # парсим название карточки
-        soup = BeautifulSoup(r.text, "html.parser")
-        # эвристика выбор названия: заголовки h1/h2, meta og:title, title
-        title = None
-        if soup.find("h1"):
-            title = soup.find("h1").get_text(strip=True)
-        elif soup.find("h2"):
-            title = soup.find("h2").get_text(strip=True)
-        if not title:
-            meta_og = soup.find("meta", property="og:title")
-            if meta_og and meta_og.get("content"):
-                title = meta_og["content"]
-        if not title:
-            title = soup.title.string if soup.title else ""
-
-        a, b, articles = parse_a_b_c(title)
-
-        # дополнительные попытки найти артикулы в тексте страницы (таблицы характеристик)
-        if not articles:
-            # ищем patterns в тексте: типичные артикула (буквы-цифры с дефисами)
-            page_text = soup.get_text(" ", strip=True)
-            # ищем все подходящие по длине/формату
-            found = re.findall(r"\b[A-Z0-9]{2,4}[-][A-Z0-9\-]{2,}\b", page_text, flags=re.IGNORECASE)
-            # фильтруем/уникализируем
-            found = [f for f in dict.fromkeys(found)]  # preserve order, unique
-            if found:
-                # можно выбрать первые N
-                articles = found[:6]
-
-        results.append({
-            "query": query,
-            "product_url": link,
-            "title": title,
-            "a": a,
-            "b": b,
-            "articles": "|".join(articles) if articles else "",
-        })
+        if fut.exception() is not None:
+            logger.warning(f"Card {product_links[i]} failed: {fut.exception()}")
+            continue
+        if fut.result():
+            results.append(fut.result())
+    if listing:
+        order = {row["product_url"]: i for i, row in enumerate(listing)}
+        results.sort(key=lambda row: order[row["product_url"]])
     return results
 
 def main():
@@ -282,11 +344,8 @@ def main():
         res = process_search(q, sess, proxy=proxy)
         all_results.extend(res)
 
-        # делаем паузу между запросами к сайту
-        random_pause()
-
     # записываем CSV
-    fieldnames = ["query", "product_url", "title", "a", "b", "articles"]
+    fieldnames = ["query", "product_url", "title", "a", "b", "articles", "price", "stock", "source"]
     with open(OUTPUT_CSV, "w", encoding="utf-8-sig", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
@@ -294,6 +353,7 @@ def main():
             writer.writerow(row)
 
     logger.info(f"Saved {len(all_results)} records to {OUTPUT_CSV}")
+    logger.info(f"Rate limits:\n{limiter.stats()}")
 
 
 if __name__ == "__main__":
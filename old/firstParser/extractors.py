@@ -0,0 +1,63 @@
+"""
+extractors.py
+
+Разбор страниц выдачи, который выполняется в пуле процессов (parse_pool.py).
+
+Функции отсюда передаются в процесс по имени модуля, поэтому модуль
+ничего не делает при импорте: не настраивает логирование, не открывает
+базы кэша и не создаёт лимитеры. Возвращают они простые данные
+(числа, строки, кортежи), а не узлы дерева.
+
+    extract_offer    — asyncMain.py: первая карточка → (цена, ссылка);
+    extract_products — score2Async.py: все карточки → [(name, price, url), ...];
+    extract_match    — all-sites.py: первая карточка с запросом в тексте → (название, цена).
+"""
+
+import urllib.parse
+from typing import List, Optional, Tuple
+
+import html_extract as hx
+from prices import find_prices, price_raw, price_value
+
+
+def extract_offer(html: str, url: str, base: str, item_css: str) -> Tuple[Optional[float], Optional[str]]:
+    """Первая карточка → (цена, ссылка); без карточки — цена со всей страницы."""
+    doc = hx.parse(html)
+    item = hx.select_one(doc, item_css)
+    if item is None:  # у lxml-элемента без детей bool() ложен
+        price = price_value(hx.text(doc))
+        return price, url if price else None
+    price = price_value(hx.text(item))
+    href = hx.attr(hx.select_one(item, 'a'), 'href')
+    return price, urllib.parse.urljoin(base, href) if href else url
+
+
+def extract_products(html: str, url: str, item_css: str, name_css: str,
+                     price_css: str) -> List[Tuple[str, float, str]]:
+    """Все карточки выдачи с названием и ценой → [(name, price, url), ...]."""
+    doc = hx.parse(html)
+    cards = []
+    for prod in hx.select(doc, item_css):
+        name = hx.select_one(prod, name_css)
+        price = hx.select_one(prod, price_css)
+        if name is not None and price is not None:
+            cards.append((hx.text(name, "", strip=False).strip(), hx.text(price)))
+    prices = find_prices(price_text for _, price_text in cards)
+    return [(name, p.value, url) for (name, _), p in zip(cards, prices) if p]
+
+
+def extract_match(html: str, query: str, item_css: str, fallback_css: str,
+                  price_from_parent: bool) -> Optional[Tuple[str, str]]:
+    """Первая карточка, в тексте которой есть запрос → (название, цена)."""
+    doc = hx.parse(html)
+    items = hx.select(doc, item_css) or hx.select(doc, fallback_css)
+    qlow = query.lower()
+    for it in items:
+        title = hx.text(it)
+        if title and qlow in title.lower():
+            scope = hx.parent(it) if price_from_parent else it
+            price = price_raw(hx.text(scope)) if scope is not None else None
+            if not price:
+                price = price_raw(hx.text(doc))
+            return (title.strip(), price or "Цена не найдена")
+    return None
@@ -0,0 +1,86 @@
+"""
+fanout.py
+
+Параллельный опрос нескольких сайтов по одной позиции.
+
+Вместо «водопада» (chipdip → laserparts → tze1 → zipzip по очереди)
+все сайты опрашиваются одновременно, поэтому промах стоит не сумму
+четырёх запросов, а самый долгий из них.
+
+Режимы:
+- "first"   — вернуть первый подходящий ответ, остальные запросы отменить;
+- "ordered" — вернуть подходящий ответ сайта с наивысшим приоритетом
+              (результат совпадает с водопадом); ждём только сайты,
+              стоящие в списке выше найденного;
+- "all"     — собрать все подходящие ответы в порядке приоритета.
+
+Приоритет сайта — его позиция в списке jobs; при одновременном
+завершении нескольких запросов побеждает сайт, стоящий выше.
+
+skip(site) — сайты, которые сейчас опрашивать бессмысленно (например,
+открыт выключатель в resilience.py): они сразу считаются промахом,
+запрос не запускается и в "ordered" их не ждут.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+MODES = ("first", "ordered", "all")
+
+Job = Tuple[str, Callable[[], Awaitable[Any]]]
+
+
+async def race_sites(
+    jobs: Sequence[Job],
+    accept: Callable[[Any], bool] = bool,
+    mode: str = "ordered",
+    on_error: Optional[Callable[[str, BaseException], None]] = None,
+    skip: Optional[Callable[[str], bool]] = None,
+) -> List[Tuple[str, Any]]:
+    """
+    Запускает все jobs одновременно и возвращает список (site, result).
+
+    jobs     — пары (имя сайта, фабрика корутины) в порядке приоритета;
+    accept   — признак подходящего ответа (по умолчанию — непустой);
+    on_error — вызывается для исключений сайта, сам сайт считается промахом;
+    skip     — сайты, для которых skip(site) истинно, не запускаются.
+
+    Для "first" и "ordered" список содержит не более одного элемента.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Неизвестный режим: {mode!r} (ожидается один из {MODES})")
+
+    if skip:
+        jobs = [(site, factory) for site, factory in jobs if not skip(site)]
+    tasks = [asyncio.ensure_future(factory()) for _, factory in jobs]
+    index = {task: i for i, task in enumerate(tasks)}
+    pending = set(tasks)
+    hits = {}
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = index[task]
+                try:
+                    result = task.result()
+                except Exception as e:
+                    if on_error:
+                        on_error(jobs[i][0], e)
+                    continue
+                if accept(result):
+                    hits[i] = result
+
+            if mode == "all" or not hits:
+                continue
+            best = min(hits)
+            # в "ordered" ждём, пока не ответят все сайты выше найденного
+            if mode == "first" or all(tasks[j].done() for j in range(best)):
+                return [(jobs[best][0], hits[best])]
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    return [(jobs[i][0], hits[i]) for i in sorted(hits)]
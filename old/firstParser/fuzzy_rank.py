@@ -0,0 +1,73 @@
+"""
+fuzzy_rank.py
+
+Пакетное нечёткое сравнение запроса с кандидатами на rapidfuzz.
+
+Раньше каждый кандидат нормализовался и сравнивался в цикле Python
+(normalize + fuzz.ratio на каждой итерации). Здесь кандидаты
+нормализуются один раз при создании Candidates, а вся матрица оценок
+считается в C: process.extractOne для лучшего кандидата
+и process.cdist (в несколько потоков) для top-k.
+
+    cands = Candidates(names, processor=normalize)
+    cands.best(query, score_cutoff=70)     → (индекс, оценка) или None
+    cands.top(query, k=5)                  → [(индекс, оценка), ...] по убыванию оценки
+
+Оценки — fuzz.ratio (0..100). При равных оценках раньше идёт кандидат
+с меньшим индексом, как и в прежних циклах с `if score > best_score`.
+"""
+
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+WORKERS = -1            # потоков для cdist: -1 — все ядра
+PARALLEL_MIN = 2000     # на меньших матрицах потоки дороже самого расчёта
+
+
+def normalize(s: str) -> str:
+    return s.lower().replace("-", "").replace(" ", "")
+
+
+class Candidates:
+    def __init__(self, candidates: Sequence[str],
+                 processor: Callable[[str], str] = normalize, scorer=fuzz.ratio):
+        self.candidates = list(candidates)
+        self.processor = processor
+        self.scorer = scorer
+        self.keys = [processor(c or "") for c in self.candidates]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def best(self, query: str, score_cutoff: float = 0) -> Optional[Tuple[int, float]]:
+        if not self.keys:
+            return None
+        found = process.extractOne(self.processor(query), self.keys, scorer=self.scorer,
+                                   processor=None, score_cutoff=score_cutoff)
+        if not found or found[1] <= 0:
+            return None
+        _, score, index = found
+        return index, score
+
+    def top(self, query: str, k: int = 5, score_cutoff: float = 0) -> List[Tuple[int, float]]:
+        if not self.keys:
+            return []
+        # один запрос: строками матрицы делаем кандидатов, чтобы cdist распараллелил их
+        scores = process.cdist(self.keys, [self.processor(query)], scorer=self.scorer, processor=None,
+                               score_cutoff=score_cutoff, workers=self._workers(len(self.keys)))
+        return _top_k(scores[:, 0], k, score_cutoff)
+
+    @staticmethod
+    def _workers(cells: int) -> int:
+        return WORKERS if cells >= PARALLEL_MIN else 1
+
+
+def _top_k(row: np.ndarray, k: int, score_cutoff: float) -> List[Tuple[int, float]]:
+    if k < len(row):
+        idx = np.argpartition(-row, k - 1)[:k]
+    else:
+        idx = np.arange(len(row))
+    idx = idx[np.lexsort((idx, -row[idx]))]
+    return [(int(i), float(row[i])) for i in idx if row[i] > 0 and row[i] >= score_cutoff]
@@ -0,0 +1,195 @@
+"""
+html_extract.py
+
+Единый небольшой API извлечения данных из HTML поверх сменного парсера.
+
+Скрипты строили BeautifulSoup(html, "html.parser") и гоняли по нему
+select_one / get_text — при загруженном пуле запросов это основная
+нагрузка на CPU. Здесь те же операции, но дерево строит один из бэкендов:
+
+- "lxml" — lxml.html + cssselect (по умолчанию, если установлены);
+- "bs4"  — BeautifulSoup с html.parser, как было раньше.
+
+API:
+    doc = parse(html)                 # backend=None → BACKEND
+    select(node, css) / select_one(node, css)
+    text(node, sep=" ", strip=True)   # как Tag.get_text(sep, strip=True)
+    attr(node, name, default=None)
+    parent(node)
+    containing(node, pattern)         # как [s.parent for s in find_all(string=pattern)]
+    matching(node, pattern)           # то же, но пары (родитель, строка)
+
+text() воспроизводит правила bs4: строки из <script>, <style>, <template>
+и комментарии не попадают в текст, хвосты после них — попадают. С strip=True
+результат совпадает с bs4 полностью; с strip=False парсеры могут по-разному
+сохранять пробельные строки между тегами.
+
+Сравнение бэкендов на сохранённой странице:
+    python html_extract.py [request.html] [повторов]
+"""
+
+import sys
+import time
+from typing import Any, Dict, List, Optional, Pattern, Tuple, Union
+
+try:
+    import lxml.html
+    from lxml import etree
+    from lxml.cssselect import CSSSelector
+except ImportError:
+    lxml = None
+
+BACKENDS = ("lxml", "bs4")
+BACKEND = "lxml" if lxml is not None else "bs4"
+
+_SKIP_TEXT_TAGS = {"script", "style", "template"}
+_selectors: Dict[str, Any] = {}
+
+
+def _is_lxml(node) -> bool:
+    return lxml is not None and isinstance(node, etree._Element)
+
+
+# ---------- разбор ----------
+def parse(html: Union[str, bytes], backend: Optional[str] = None):
+    backend = backend or BACKEND
+    if backend == "lxml":
+        if lxml is None:
+            raise RuntimeError("lxml/cssselect не установлены — используйте backend='bs4'")
+        if isinstance(html, str) and html.lstrip().startswith("<?xml"):
+            html = html.encode("utf-8")  # lxml не принимает str с XML-декларацией
+        if not html or not html.strip():
+            html = "<html></html>"
+        return lxml.html.document_fromstring(html)
+    if backend == "bs4":
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(html, "html.parser")
+    raise ValueError(f"Неизвестный бэкенд: {backend!r} (ожидается один из {BACKENDS})")
+
+
+# ---------- выборка ----------
+def _selector(css: str):
+    sel = _selectors.get(css)
+    if sel is None:
+        sel = _selectors[css] = CSSSelector(css, translator="html")
+    return sel
+
+
+def select(node, css: str) -> List[Any]:
+    if _is_lxml(node):
+        return _selector(css)(node)
+    return node.select(css)
+
+
+def select_one(node, css: str):
+    if _is_lxml(node):
+        found = _selector(css)(node)
+        return found[0] if found else None
+    return node.select_one(css)
+
+
+def attr(node, name: str, default: Optional[str] = None) -> Optional[str]:
+    if node is None:
+        return default
+    value = node.get(name, default)
+    if isinstance(value, list):  # bs4: многозначные атрибуты (class, rel)
+        value = " ".join(value)
+    return value
+
+
+def parent(node):
+    if _is_lxml(node):
+        return node.getparent()
+    return node.parent
+
+
+# ---------- текст ----------
+def _lxml_strings(node, out: List[str]):
+    tag = node.tag
+    if isinstance(tag, str) and tag.lower() not in _SKIP_TEXT_TAGS:
+        if node.text:
+            out.append(node.text)
+        for child in node:
+            _lxml_strings(child, out)
+            if child.tail:
+                out.append(child.tail)
+
+
+def strings(node) -> List[str]:
+    """Текстовые строки узла в порядке документа (без script/style/комментариев)."""
+    if _is_lxml(node):
+        if isinstance(node.tag, str) and node.tag.lower() in _SKIP_TEXT_TAGS:
+            return [node.text] if node.text else []  # bs4 отдаёт содержимое самого <script>
+        out: List[str] = []
+        _lxml_strings(node, out)
+        return out
+    return list(node.strings)
+
+
+def text(node, sep: str = " ", strip: bool = True) -> str:
+    if node is None:
+        return ""
+    if not _is_lxml(node):
+        return node.get_text(sep, strip=strip)
+    parts = strings(node)
+    if strip:
+        parts = [p.strip() for p in parts]
+        parts = [p for p in parts if p]
+    return sep.join(parts)
+
+
+def matching(node, pattern: Pattern) -> List[Tuple[Any, str]]:
+    """Пары (родительский элемент, строка) для текстовых строк, в которых есть pattern."""
+    if not _is_lxml(node):
+        return [(s.parent, str(s)) for s in node.find_all(string=pattern)]
+    found = []
+    for el in node.iter():
+        # как и find_all(string=...), ищем везде: в <script>/<style> и в комментариях
+        if el.text and pattern.search(el.text):
+            found.append((el if isinstance(el.tag, str) else el.getparent(), el.text))
+        if el is not node and el.tail and pattern.search(el.tail):
+            found.append((el.getparent(), el.tail))
+    return found
+
+
+def containing(node, pattern: Pattern) -> List[Any]:
+    """Родительские элементы текстовых строк, в которых есть pattern."""
+    return [parent for parent, _ in matching(node, pattern)]
+
+
+# ---------- сравнение бэкендов ----------
+BENCH_SELECTORS = [
+    "div.product",
+    "div.name a",
+    "div.jshop_price span",
+    ".product, .item, .search-result",
+    "a[href]",
+]
+
+
+def _extract_all(doc) -> List[Any]:
+    out: List[Any] = [text(doc)]
+    for css in BENCH_SELECTORS:
+        out.append([(text(n), attr(n, "href")) for n in select(doc, css)])
+    return out
+
+
+def benchmark(path: str = "request.html", repeat: int = 20):
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    available = [b for b in BACKENDS if b != "lxml" or lxml is not None]
+    results = {}
+    for backend in available:
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            out = _extract_all(parse(html, backend))
+        ms = (time.perf_counter() - t0) / repeat * 1000
+        results[backend] = out
+        print(f"{backend:<5} {ms:8.2f} мс на страницу ({len(html) // 1024} КБ, {repeat} повторов)")
+    if len(results) > 1:
+        same = all(r == results["bs4"] for r in results.values())
+        print("Результаты совпадают" if same else "ВНИМАНИЕ: результаты бэкендов различаются")
+
+
+if __name__ == "__main__":
+    benchmark(*(sys.argv[1:2] or ["request.html"]), *(int(a) for a in sys.argv[2:3]))
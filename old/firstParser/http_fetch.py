@@ -0,0 +1,204 @@
+"""
+http_fetch.py
+
+Общий слой загрузки страниц: условные запросы + сжатие.
+
+- Для каждого URL запоминаются ETag / Last-Modified и тело ответа
+  (ValidatorStore, SQLite). Повторный запрос уходит с If-None-Match /
+  If-Modified-Since; на 304 возвращается сохранённое тело — страница
+  (~165 КБ у карточки товара) заново не скачивается.
+- Accept-Encoding формируется из того, что реально умеем распаковать:
+  gzip и deflate всегда, br — если установлен brotli/brotlicffi,
+  zstd — если установлен zstandard. Распаковка делается здесь же,
+  а не на стороне клиента, поэтому поведение одинаково для aiohttp и requests.
+
+Ответ отдаётся как Fetched(status_code, text, url, revalidated, headers):
+304 с найденным телом превращается в 200 с revalidated=True.
+"""
+
+import gzip
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import urlencode
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ACCEPT_ENCODING = ", ".join(
+    ["gzip", "deflate"]
+    + (["br"] if brotli else [])
+    + (["zstd"] if zstandard else [])
+)
+
+Fetched = namedtuple("Fetched", "status_code text url revalidated headers")
+
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.I)
+
+
+# ---------- хранилище валидаторов ----------
+class ValidatorStore:
+    def __init__(self, path: str = "http_cache.db"):
+        # одно соединение на все потоки (карточки в chipdip.ru.py грузятся пулом), доступ — под замком
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS validators (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            body BLOB NOT NULL,
+            stored_at REAL NOT NULL
+        )
+        """)
+        self.revalidated = 0
+        self.downloaded = 0
+
+    def get(self, url: str) -> Optional[Tuple[Optional[str], Optional[str], bytes]]:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT etag, last_modified, body FROM validators WHERE url=?", (url,)
+            ).fetchone()
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], text: str):
+        body = zlib.compress(text.encode("utf-8"))
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO validators (url, etag, last_modified, body, stored_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, body, time.time()),
+            )
+
+    def stats(self) -> str:
+        return f"скачано {self.downloaded}, подтверждено 304: {self.revalidated}"
+
+    def close(self):
+        self.conn.close()
+
+
+# ---------- заголовки и распаковка ----------
+def request_headers(url: str, store: Optional[ValidatorStore] = None,
+                    headers: Optional[Mapping[str, str]] = None) -> Dict[str, str]:
+    out = dict(headers or {})
+    out["Accept-Encoding"] = ACCEPT_ENCODING
+    cached = store.get(url) if store else None
+    if cached:
+        etag, last_modified, _ = cached
+        if etag:
+            out["If-None-Match"] = etag
+        if last_modified:
+            out["If-Modified-Since"] = last_modified
+    return out
+
+
+def decode_body(raw: bytes, content_encoding: Optional[str]) -> bytes:
+    """Снимает Content-Encoding (кодировки применяются в обратном порядке)."""
+    if not content_encoding:
+        return raw
+    for enc in reversed([e.strip().lower() for e in content_encoding.split(",")]):
+        if enc in ("", "identity"):
+            continue
+        decompress = _DECODERS.get(enc)
+        if decompress is None:
+            raise ValueError(f"Не умеем распаковывать Content-Encoding: {enc}")
+        try:
+            raw = decompress(raw)
+        except Exception as e:
+            raise ValueError(f"Повреждённое тело ({enc}): {e}") from e
+    return raw
+
+
+def _inflate(raw: bytes) -> bytes:
+    try:
+        return zlib.decompress(raw)
+    except zlib.error:
+        return zlib.decompress(raw, -zlib.MAX_WBITS)  # «сырой» deflate без заголовка
+
+
+_DECODERS = {"gzip": gzip.decompress, "x-gzip": gzip.decompress, "deflate": _inflate}
+if brotli:
+    _DECODERS["br"] = brotli.decompress
+if zstandard:
+    _DECODERS["zstd"] = lambda raw: zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+
+
+def _charset(content_type: Optional[str], body: bytes) -> str:
+    if content_type and "charset=" in content_type:
+        return content_type.split("charset=", 1)[1].split(";")[0].strip().strip('"') or "utf-8"
+    m = _CHARSET_RE.search(body[:4096])
+    return m.group(1).decode("ascii") if m else "utf-8"
+
+
+def complete(url: str, status: int, headers: Mapping[str, str], raw: bytes,
+             store: Optional[ValidatorStore] = None, final_url: Optional[str] = None) -> Fetched:
+    """
+    Превращает сырой ответ в Fetched и обновляет валидаторы.
+    Валидаторы хранятся по запрошенному url (с ним уйдёт следующий запрос),
+    а в Fetched.url — final_url, адрес после редиректов: от него строятся
+    абсолютные ссылки.
+    """
+    final_url = final_url or url
+    if status == 304 and store:
+        cached = store.get(url)
+        if cached:
+            store.revalidated += 1
+            return Fetched(200, zlib.decompress(cached[2]).decode("utf-8"), final_url, True, headers)
+
+    body = decode_body(raw, headers.get("Content-Encoding"))
+    try:
+        text = body.decode(_charset(headers.get("Content-Type"), body), errors="replace")
+    except LookupError:
+        text = body.decode("utf-8", errors="replace")
+
+    if status == 200 and store:
+        store.downloaded += 1
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        if etag or last_modified:
+            store.put(url, etag, last_modified, text)
+    return Fetched(status, text, final_url, False, headers)
+
+
+def with_params(url: str, params: Optional[Mapping] = None) -> str:
+    if not params:
+        return url
+    return url + ("&" if "?" in url else "?") + urlencode(params)
+
+
+# ---------- клиенты ----------
+async def fetch_async(session, url: str, store: Optional[ValidatorStore] = None,
+                      timeout: float = 10, headers: Optional[Mapping[str, str]] = None) -> Fetched:
+    """aiohttp: сам распаковываем тело, поэтому auto_decompress=False."""
+    async with session.get(url, headers=request_headers(url, store, headers),
+                           timeout=timeout, auto_decompress=False) as resp:
+        raw = await resp.read()
+        return complete(url, resp.status, resp.headers, raw, store, str(resp.url))
+
+
+def fetch_sync(session, url: str, store: Optional[ValidatorStore] = None,
+               params: Optional[Mapping] = None, headers: Optional[Mapping[str, str]] = None,
+               timeout: float = 10, allow_redirects: bool = True) -> Fetched:
+    """requests: читаем r.raw без decode_content, чтобы распаковать самим."""
+    url = with_params(url, params)
+    r = session.get(url, headers=request_headers(url, store, headers), timeout=timeout,
+                    allow_redirects=allow_redirects, stream=True)
+    try:
+        raw = r.raw.read(decode_content=False)
+    finally:
+        r.close()
+    return complete(url, r.status_code, r.headers, raw, store, r.url)
@@ -0,0 +1,139 @@
+"""
+lookup_cache.py
+
+Постоянный (на диске) кэш ответов поиска по сайтам.
+
+Ключ — (сайт, нормализованный запрос), значение — тело ответа
+(сжатое zlib). Хранится в SQLite, поэтому переживает перезапуск:
+повторный прогон по тем же 35k позициям платит только за новые
+и устаревшие записи.
+
+- TTL задаётся на сайт (ttl={"chipdip": 3 * 86400, ...}), иначе default_ttl;
+- размер ограничен max_bytes, при превышении вытесняются записи,
+  к которым дольше всего не обращались (LRU);
+- hits / misses / stale считаются по каждому сайту.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+_SPACES_RE = re.compile(r"\s+")
+
+DEFAULT_TTL = 3 * 24 * 3600
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def normalize_query(query: str) -> str:
+    return _SPACES_RE.sub(" ", query).strip().lower()
+
+
+class LookupCache:
+    def __init__(self, path: str = "lookup_cache.db",
+                 ttl: Optional[Dict[str, float]] = None,
+                 default_ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.ttl = dict(ttl or {})
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.counters: Dict[str, List[int]] = {}  # site -> [hits, misses, stale]
+
+        # одно соединение на все потоки (в parser-docker каждый перезапуск Streamlit —
+        # новый поток), доступ — под замком
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS lookup (
+            site TEXT NOT NULL,
+            query TEXT NOT NULL,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            stored_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            PRIMARY KEY (site, query)
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS lookup_accessed ON lookup (accessed_at)")
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM lookup").fetchone()[0]
+
+    def _count(self, site: str, kind: int):
+        self.counters.setdefault(site, [0, 0, 0])[kind] += 1
+
+    def get(self, site: str, query: str) -> Optional[str]:
+        """Тело ответа или None, если записи нет или она устарела."""
+        key = normalize_query(query)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT body, stored_at FROM lookup WHERE site=? AND query=?", (site, key)
+            ).fetchone()
+            if row is None:
+                self._count(site, 1)
+                return None
+            body, stored_at = row
+            now = time.time()
+            if now - stored_at > self.ttl.get(site, self.default_ttl):
+                self._count(site, 2)
+                return None
+            self.conn.execute(
+                "UPDATE lookup SET accessed_at=? WHERE site=? AND query=?", (now, site, key)
+            )
+            self._count(site, 0)
+        return zlib.decompress(body).decode("utf-8")
+
+    def put(self, site: str, query: str, body: str):
+        key = normalize_query(query)
+        blob = zlib.compress(body.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self.conn.execute(
+                "SELECT size FROM lookup WHERE site=? AND query=?", (site, key)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO lookup (site, query, body, size, stored_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (site, key, blob, len(blob), now, now),
+            )
+            self.total_bytes += len(blob) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def evict(self, target: float = 0.9):
+        """Вытесняет самые давние по обращению записи до target * max_bytes."""
+        with self._lock:
+            self._evict(target)
+
+    def _evict(self, target: float = 0.9):
+        limit = int(self.max_bytes * target)
+        while self.total_bytes > limit:
+            rows = self.conn.execute(
+                "SELECT site, query, size FROM lookup ORDER BY accessed_at LIMIT 500"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            self.conn.execute("BEGIN")
+            for site, query, size in rows:
+                self.conn.execute("DELETE FROM lookup WHERE site=? AND query=?", (site, query))
+                self.total_bytes -= size
+                if self.total_bytes <= limit:
+                    break
+            self.conn.execute("COMMIT")
+
+    def stats(self) -> str:
+        parts = []
+        with self._lock:
+            counters = sorted((site, list(c)) for site, c in self.counters.items())
+        for site, (hits, misses, stale) in counters:
+            total = hits + misses + stale
+            ratio = hits / total if total else 0.0
+            parts.append(f"{site}: hit {hits}, miss {misses}, stale {stale} ({ratio:.0%})")
+        return "; ".join(parts) or "кэш не использовался"
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,78 @@
+"""
+parse_pool.py
+
+Разбор HTML в пуле процессов, чтобы не блокировать event loop.
+
+Страница ~165 КБ разбирается десятки миллисекунд; если делать это прямо
+в корутине, на это время встают все запросы в полёте. Здесь корутина
+отдаёт тело страницы в ProcessPoolExecutor и получает обратно компактный
+результат — например, список (name, price, url).
+
+    parse_pool = ParsePool(PARSE_PROCESSES)
+    products = await parse_pool.run(extract_products, html, url, ...)
+    ...
+    parse_pool.close()
+
+Функция разбора должна быть объявлена на верхнем уровне модуля без побочных
+эффектов при импорте (её передают в процесс по имени; см. extractors.py)
+и возвращать простые данные, а не узлы дерева. Запускаемый скрипт spawn
+всё равно импортирует в каждом процессе заново (как __mp_main__), поэтому
+базы, логирование и лимитеры скрипт создаёт в main(), а не при импорте.
+
+workers=None — по числу ядер, workers=0 — разбор в текущем процессе
+(для отладки и маленьких прогонов). Процессы запускаются через spawn:
+fork процесса с работающим event loop и потоками резолвера aiohttp
+может унести в дочерний процесс чужие захваченные блокировки.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class ParsePool:
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.jobs = 0
+        self.errors = 0
+        self.busy = 0.0  # суммарное время ожидания результатов, сек
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """Выполняет func(*args) в пуле; исключение из func пробрасывается как есть."""
+        t0 = time.perf_counter()
+        try:
+            if self.workers == 0:
+                return func(*args)
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), func, *args)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.jobs += 1
+            self.busy += time.perf_counter() - t0
+
+    def stats(self) -> str:
+        avg = self.busy / self.jobs * 1000 if self.jobs else 0.0
+        mode = f"{self.workers} проц." if self.workers else "в основном процессе"
+        return f"разбор ({mode}): {self.jobs} стр., ошибок {self.errors}, в среднем {avg:.1f} мс"
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
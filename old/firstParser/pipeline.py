@@ -0,0 +1,182 @@
+"""
+pipeline.py
+
+Потоковый конвейер reader → fetch → parse → writer на asyncio.Queue.
+
+В отличие от «пачка + gather», медленная позиция не задерживает остальные:
+каждый fetch-воркер берёт следующую позицию, как только освободился,
+поэтому семафор запросов занят постоянно. Очереди ограничены по размеру —
+если writer не успевает, очередь перед ним заполняется и притормаживает
+parse, а за ним и fetch (backpressure).
+
+По каждой стадии считается число позиций, время работы и загрузка —
+по отчёту видно, что тормозит: сеть, разбор или запись.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+_STOP = object()
+
+
+class StageStats:
+    """Счётчики одной стадии конвейера."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0  # суммарное время работы всех воркеров стадии, сек
+
+    def add(self, seconds: float):
+        self.items += 1
+        self.busy += seconds
+
+    def rate(self) -> float:
+        """Пропускная способность стадии, шт/с (по чистому времени работы)."""
+        if not self.busy:
+            return 0.0
+        return self.items * self.workers / self.busy
+
+    def utilization(self, wall: float) -> float:
+        """Доля времени, которую воркеры стадии были заняты (0..1)."""
+        if wall <= 0:
+            return 0.0
+        return self.busy / (wall * self.workers)
+
+    def report(self, wall: float) -> str:
+        return (f"{self.name:<7} {self.items:>7} шт  {self.rate():>9.1f} шт/с"
+                f"  загрузка {self.utilization(wall):>6.1%}  ошибок {self.errors}")
+
+
+async def run_pipeline(
+    source: Iterable[Any],
+    fetch: Callable[[Any], Awaitable[Any]],
+    parse: Callable[[Any, Any], Any],
+    write: Callable[[Any, Any], None],
+    fetch_workers: int = 10,
+    parse_workers: int = 1,
+    queue_size: int = 100,
+) -> Dict[str, Any]:
+    """
+    Прогоняет позиции из source через конвейер.
+
+    fetch(item)      — корутина, сетевая часть (ошибка → raw=None);
+    parse(item, raw) — синхронный разбор, возвращает строку результата или None;
+    write(item, row) — синхронная запись, вызывается по одной позиции за раз,
+                       в том числе для row=None (для учёта прогресса).
+
+    Возвращает StageStats по стадиям (reader, fetch, parse, writer)
+    и общее время работы в ключе "wall".
+    """
+    fetch_q: asyncio.Queue = asyncio.Queue(queue_size)
+    parse_q: asyncio.Queue = asyncio.Queue(queue_size)
+    write_q: asyncio.Queue = asyncio.Queue(queue_size)
+
+    stats = {
+        "reader": StageStats("reader", 1),
+        "fetch": StageStats("fetch", fetch_workers),
+        "parse": StageStats("parse", parse_workers),
+        "writer": StageStats("writer", 1),
+    }
+
+    async def reader():
+        it = iter(source)
+        while True:
+            t0 = time.perf_counter()
+            item = next(it, _STOP)
+            if item is _STOP:
+                return
+            stats["reader"].add(time.perf_counter() - t0)
+            await fetch_q.put(item)
+
+    async def fetcher():
+        while True:
+            item = await fetch_q.get()
+            if item is _STOP:
+                return
+            t0 = time.perf_counter()
+            try:
+                raw = await fetch(item)
+            except Exception as e:
+                logging.warning(f"Ошибка загрузки {item}: {e}")
+                stats["fetch"].errors += 1
+                raw = None
+            stats["fetch"].add(time.perf_counter() - t0)
+            await parse_q.put((item, raw))
+
+    async def parser():
+        while True:
+            job = await parse_q.get()
+            if job is _STOP:
+                return
+            item, raw = job
+            t0 = time.perf_counter()
+            try:
+                row = parse(item, raw)
+            except Exception as e:
+                logging.warning(f"Ошибка разбора {item}: {e}")
+                stats["parse"].errors += 1
+                row = None
+            stats["parse"].add(time.perf_counter() - t0)
+            await write_q.put((item, row))
+
+    async def writer():
+        while True:
+            job = await write_q.get()
+            if job is _STOP:
+                return
+            t0 = time.perf_counter()
+            write(*job)
+            stats["writer"].add(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    reader_task = asyncio.create_task(reader())
+    fetch_tasks = [asyncio.create_task(fetcher()) for _ in range(fetch_workers)]
+    parse_tasks = [asyncio.create_task(parser()) for _ in range(parse_workers)]
+    writer_task = asyncio.create_task(writer())
+    all_tasks = [reader_task, *fetch_tasks, *parse_tasks, writer_task]
+
+    async def shutdown():
+        # останавливаем стадии по очереди: каждая получает по _STOP на воркер
+        await reader_task
+        for _ in fetch_tasks:
+            await fetch_q.put(_STOP)
+        await asyncio.gather(*fetch_tasks)
+        for _ in parse_tasks:
+            await parse_q.put(_STOP)
+        await asyncio.gather(*parse_tasks)
+        await write_q.put(_STOP)
+        await writer_task
+
+    shutdown_task = asyncio.create_task(shutdown())
+    try:
+        # падение любой стадии (например, ошибка записи) не должно оставить
+        # остальные висеть на полных очередях
+        done, _ = await asyncio.wait([shutdown_task, *all_tasks], return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if not task.cancelled() and task.exception():
+                raise task.exception()
+    finally:
+        for task in [shutdown_task, *all_tasks]:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(shutdown_task, *all_tasks, return_exceptions=True)
+
+    wall = time.perf_counter() - started
+    stats["wall"] = wall
+    return stats
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    """Текстовый отчёт; узкое место — стадия с наибольшей загрузкой."""
+    wall = stats["wall"]
+    stages = [s for s in stats.values() if isinstance(s, StageStats)]
+    lines = [s.report(wall) for s in stages]
+    bottleneck: Optional[StageStats] = max(stages, key=lambda s: s.utilization(wall), default=None)
+    if bottleneck:
+        lines.append(f"Узкое место: {bottleneck.name} (общее время {wall:.1f} с)")
+    return "\n".join(lines)
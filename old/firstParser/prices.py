@@ -0,0 +1,192 @@
+"""
+prices.py
+
+Единое извлечение цены из текста для всех скриптов.
+
+Один заранее скомпилированный шаблон за один проход находит числа
+и (если есть) валюту за ними:
+- валюта: ₽, руб / руб. / рублей, р / р., RUB;
+- разделители тысяч: пробел, неразрывный (U+00A0) и узкий (U+202F) пробел;
+- копейки через точку или запятую: "1 234,50 ₽" → 1234.5.
+
+Число внутри артикула (CE285A, JC95-02051C, M433) ценой не считается.
+Цена с валютой всегда предпочтительнее «голого» числа; голое число
+возвращается только если в тексте нет ни одной цены с валютой и bare=True.
+
+    find_price(text)            → Price(value, raw, currency) или None
+    price_value(text)           → 1234.5 или None
+    price_raw(text)             → "1 234,50 ₽" или None
+    find_prices([text, ...])    → [Price | None, ...] — пакетно, одним проходом
+    iter_prices(text)           → (начало, конец, Price) для всех цен текста
+
+Проверка и замеры:
+    python prices.py check      # эталонный корпус prices_golden.json + CASES
+    python prices.py bench      # микробенчмарк: по одному / пакетом
+    python prices.py golden     # пересобрать корпус из request.html (проверить diff!)
+"""
+
+import bisect
+import json
+import re
+import sys
+import time
+from collections import namedtuple
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+Price = namedtuple("Price", "value raw currency")
+
+_SEP = "\x00"  # разделитель текстов в пакетном режиме: не цифра, не пробел, не буква
+
+PRICE_RE = re.compile(
+    r"(?<![\w.,])"
+    r"(?P<int>\d{1,3}(?:[ \u00A0\u202F]\d{3})+|\d+)"
+    r"(?:[.,](?P<kop>\d{1,2}))?(?![.,]?\d)"
+    r"(?:\s*(?P<cur>₽|руб(?:лей|ля|ль)?(?!\w)\.?|р(?!\w)\.?|rub(?!\w))|(?!\w))",
+    re.I,
+)
+
+GOLDEN_PATH = "prices_golden.json"
+GOLDEN_SOURCE = "request.html"
+
+# ручные случаи: текст → ожидаемое значение (None — цены нет)
+CASES = [
+    ("2800.00 руб", 2800.0),
+    ("Цена: 1 234,50 ₽", 1234.5),
+    ("1 234 567 руб.", 1234567.0),
+    ("12 990 ₽", 12990.0),
+    ("от 990р", 990.0),
+    ("990 р. за шт", 990.0),
+    ("450 RUB", 450.0),
+    ("3500 рублей", 3500.0),
+    ("2 шт по 350 руб", 350.0),
+    ("CE285A 1 200 ₽", 1200.0),
+    ("JC95-02051C | JC92-02522A", None),
+    ("HP LJ M433/ M436", None),
+    ("Картридж 12.345 шт", None),
+    ("Корзина 0 0.00 руб", 0.0),
+    ("Код: 70391", 70391.0),
+    ("100 рабочих дней", 100.0),
+    ("", None),
+]
+
+
+def _make(m) -> Price:
+    value = float(re.sub(r"\D", "", m.group("int")) + "." + (m.group("kop") or "0"))
+    return Price(value, m.group(0), bool(m.group("cur")))
+
+
+def find_price(text: Optional[str], bare: bool = True) -> Optional[Price]:
+    """Первая цена с валютой; иначе первое голое число (если bare)."""
+    if not text:
+        return None
+    first_bare = None
+    for m in PRICE_RE.finditer(text):
+        if m.group("cur"):
+            return _make(m)
+        if first_bare is None:
+            first_bare = m
+    return _make(first_bare) if bare and first_bare is not None else None
+
+
+def price_value(text: Optional[str], bare: bool = True) -> Optional[float]:
+    p = find_price(text, bare)
+    return p.value if p else None
+
+
+def price_raw(text: Optional[str], bare: bool = True) -> Optional[str]:
+    p = find_price(text, bare)
+    return p.raw if p else None
+
+
+def iter_prices(text: Optional[str], bare: bool = True) -> Iterator[Tuple[int, int, Price]]:
+    """Все цены текста по порядку вместе с позициями (для привязки по смещению)."""
+    for m in PRICE_RE.finditer(text or ""):
+        if bare or m.group("cur"):
+            yield m.start(), m.end(), _make(m)
+
+
+def find_prices(texts: Iterable[Optional[str]], bare: bool = True) -> List[Optional[Price]]:
+    """Пакетный find_price: тексты склеиваются и просматриваются одним finditer."""
+    texts = [t or "" for t in texts]
+    starts = []
+    pos = 0
+    for t in texts:
+        starts.append(pos)
+        pos += len(t) + 1
+    found: List[Optional[Price]] = [None] * len(texts)
+    has_cur = [False] * len(texts)
+    for m in PRICE_RE.finditer(_SEP.join(texts)):
+        i = bisect.bisect_right(starts, m.start()) - 1
+        if has_cur[i]:
+            continue
+        if m.group("cur"):
+            found[i] = _make(m)
+            has_cur[i] = True
+        elif bare and found[i] is None:
+            found[i] = _make(m)
+    return found
+
+
+# ---------- эталонный корпус и замеры ----------
+def _corpus_blocks(path: str = GOLDEN_SOURCE) -> List[str]:
+    """Тексты элементов сохранённой страницы (до 300 символов, с цифрами), без повторов."""
+    import html_extract as hx
+    with open(path, encoding="utf-8") as f:
+        doc = hx.parse(f.read())
+    blocks, seen = [], set()
+    for node in hx.select(doc, "div, span, td, li, p, a, h1, h2, h3"):
+        t = hx.text(node)
+        if t and len(t) <= 300 and any(c.isdigit() for c in t) and t not in seen:
+            seen.add(t)
+            blocks.append(t)
+    return blocks
+
+
+def build_golden(path: str = GOLDEN_PATH, source: str = GOLDEN_SOURCE):
+    blocks = _corpus_blocks(source)
+    rows = [[t, p.value if p else None, p.currency if p else None]
+            for t, p in zip(blocks, find_prices(blocks))]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False, indent=1)
+    print(f"Записано {len(rows)} блоков в {path} — проверьте diff перед коммитом")
+
+
+def check(path: str = GOLDEN_PATH) -> bool:
+    failed = 0
+    for text, expected in CASES:
+        got = price_value(text)
+        if got != expected:
+            failed += 1
+            print(f"CASE  {text!r}: ожидалось {expected}, получено {got}")
+    with open(path, encoding="utf-8") as f:
+        golden = json.load(f)
+    texts = [row[0] for row in golden]
+    for (text, value, currency), single, batch in zip(golden, map(find_price, texts), find_prices(texts)):
+        got = (single.value, single.currency) if single else (None, None)
+        if got != (value, currency) or single != batch:
+            failed += 1
+            print(f"GOLDEN {text[:80]!r}: ожидалось {(value, currency)}, получено {got}, пакетно {batch}")
+    total = len(CASES) + len(golden)
+    print(f"Проверено {total}: " + ("всё совпадает" if not failed else f"расхождений {failed}"))
+    return not failed
+
+
+def benchmark(source: str = GOLDEN_SOURCE, repeat: int = 50):
+    blocks = _corpus_blocks(source)
+    for name, run in (("по одному", lambda: [find_price(t) for t in blocks]),
+                      ("пакетом", lambda: find_prices(blocks))):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        us = (time.perf_counter() - t0) / repeat / len(blocks) * 1e6
+        print(f"{name:<10} {us:7.2f} мкс на блок ({len(blocks)} блоков, {repeat} повторов)")
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if cmd == "golden":
+        build_golden()
+    elif cmd == "bench":
+        benchmark(*sys.argv[2:3])
+    else:
+        sys.exit(0 if check() else 1)
@@ -0,0 +1,136 @@
+"""
+query_plan.py
+
+Планирование запросов до сетевой части: один поиск на артикул, а не на строку.
+
+В source.csv одна и та же деталь встречается в нескольких строках:
+"Аккумуляторная батарея Dell 312-0428" и
+"Аккумуляторная батарея Dell GD761/KD476/HK421/312-0428/..." — это один
+товар, и искать его дважды незачем. Строки объединяются (union-find
+по строкам, ключ — только канонический артикул, source_grammar.article_key),
+если все артикулы одной строки есть в другой; частичное пересечение
+(SKC600/256G и SKC600/1024G) строки не объединяет. Описание при группировке
+не учитывается: RM1-1740-040CN под разными названиями — один запрос.
+Разные детали с одним артикулом («Внешний микрофон ... CTS-EX60-K9» и
+«Встроенная камера ... CTS-EX60-K9», оригинал и «аналог») разводятся при
+раздаче: найденный товар сверяется с каждой строкой отдельно
+(score2Async.build_rows), и строка, на которую он не похож, остаётся
+без цены.
+Характеристики, похожие на артикулы (120mm, 2400MHz, HDMIx1, 19000),
+для группировки не используются.
+
+На группу — один запрос: артикул, который чаще всего встречается в её
+строках; если он уже занят другой группой — описание + артикул, иначе
+сама строка.
+Строки без артикулов ищутся как есть, но точные дубликаты (без учёта
+регистра) тоже схлопываются. Схлопывается только поиск: результат
+запроса раздаётся каждой строке группы, в том числе каждому повтору
+одной и той же строки, — строк на выходе столько же, сколько на входе:
+
+    plan = QueryPlan(source_grammar.load("source.csv"))
+    for query in plan.queries:
+        result = search(query)
+        for line in plan.lines_for(query):
+            ...
+    print(plan.report())
+
+    python query_plan.py ../../source/source.csv   # только отчёт
+"""
+
+import re
+import sys
+from collections import Counter
+from typing import Dict, FrozenSet, Iterable, List
+
+from source_grammar import PartLine, article_key
+
+MIN_KEY_LEN = 5  # короткие «артикулы» (2000, A23) слишком часто совпадают случайно
+MIN_DIGITS_KEY_LEN = 7  # чисто цифровые короче — обычно частоты, объёмы, номера серий
+SPEC_RE = re.compile(r"^\d+[A-Z]{1,5}$|^[A-Z]{2,5}X\d+$|^\d+X[A-Z]+$")  # 120MM, HDMIX1, 5XSATA
+
+
+def _groupable(key: str, min_key_len: int) -> bool:
+    if len(key) < min_key_len or SPEC_RE.match(key) or not any(c.isdigit() for c in key):
+        return False
+    return not key.isdigit() or len(key) >= MIN_DIGITS_KEY_LEN
+
+
+class QueryPlan:
+    def __init__(self, records: Iterable[PartLine], min_key_len: int = MIN_KEY_LEN):
+        records = list(records)
+        self.rows = len(records)
+        parent = list(range(len(records)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        spelling: Dict[str, str] = {}  # ключ → артикул в том виде, как встретился первым
+        all_keys: List[FrozenSet[str]] = []   # все артикулы строки — для сравнения (KHX18C10K2/16 ≠ /8)
+        line_keys: List[List[str]] = []       # надёжные артикулы — для индекса и запроса
+        by_key: Dict[str, List[int]] = {}     # ключ → строки с этим ключом
+        for i, rec in enumerate(records):
+            all_keys.append(frozenset(article_key(art) for art in rec.articles))
+            keys = []
+            for art in rec.articles:
+                k = article_key(art)
+                if _groupable(k, min_key_len) and k not in keys:
+                    keys.append(k)
+                    spelling.setdefault(k, art)
+                    by_key.setdefault(k, []).append(i)
+            line_keys.append(keys)
+
+        # строка присоединяется к строке, у которой есть все её артикулы
+        for i, keys in enumerate(line_keys):
+            if keys:
+                for j in by_key[keys[0]]:
+                    if j != i and all_keys[i] <= all_keys[j]:
+                        parent[find(i)] = find(j)
+
+        groups: Dict[object, List[int]] = {}
+        for i, (rec, keys) in enumerate(zip(records, line_keys)):
+            gid = find(i) if keys else "\0" + rec.line.lower()
+            groups.setdefault(gid, []).append(i)
+
+        self._lines: Dict[str, List[str]] = {}
+        for idxs in groups.values():
+            counts = Counter(k for i in idxs for k in line_keys[i])
+            first = records[idxs[0]]
+            query = first.line
+            if counts:
+                # самый частый артикул группы; при равенстве — встретившийся раньше
+                article = spelling[max(counts, key=counts.get)]
+                if article not in self._lines:
+                    query = article
+                elif f"{first.description} {article}".strip() not in self._lines:
+                    query = f"{first.description} {article}".strip()
+            # каждое вхождение строки — своя строка результата, как без плана
+            self._lines.setdefault(query, []).extend(records[i].line for i in idxs)
+
+    @property
+    def queries(self) -> List[str]:
+        return list(self._lines)
+
+    def lines_for(self, query: str) -> List[str]:
+        """Строки source.csv, которые обслуживает query, — с повторами, по одной на вхождение."""
+        return self._lines.get(query, [])
+
+    def fan_out(self, query: str, result) -> List[tuple]:
+        """[(строка, result), ...] для всех строк, которые обслуживает query."""
+        return [(line, result) for line in self.lines_for(query)]
+
+    @property
+    def saved(self) -> int:
+        return self.rows - len(self._lines)
+
+    def report(self) -> str:
+        share = self.saved / self.rows if self.rows else 0.0
+        return (f"План запросов: строк {self.rows}, запросов {len(self._lines)}, "
+                f"сэкономлено {self.saved} ({share:.1%})")
+
+
+if __name__ == "__main__":
+    import source_grammar
+    print(QueryPlan(source_grammar.load(sys.argv[1] if len(sys.argv) > 1 else "source100.csv")).report())
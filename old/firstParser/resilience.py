@@ -0,0 +1,220 @@
+"""
+resilience.py
+
+Повторы с джиттером, бюджет повторов и автоматические выключатели по сайту.
+
+Раньше одни скрипты повторяли запрос через фиксированный sleep(1),
+другие не повторяли вовсе. Если сайт лежит, каждая из 35k позиций всё
+равно ждала полный таймаут. Здесь политика общая:
+
+- повтор — с decorrelated jitter: пауза = min(cap, random(base, 3 × прошлая)),
+  поэтому клиенты не бьют в хост синхронными волнами;
+- бюджет повторов — каждый первый запрос добавляет budget_ratio токена,
+  каждый повтор тратит один: при массовых отказах повторов не больше
+  ~20% от обычного трафика, и повторы сами не добивают хост;
+- выключатель (circuit breaker) на сайт:
+    closed    — запросы идут, failure_threshold отказов подряд → open;
+    open      — запросы сразу отклоняются (CircuitOpenError) reset_timeout секунд;
+    half-open — по истечении пропускается один пробный запрос:
+                успех → closed, отказ → снова open (пауза удваивается до max_reset_timeout).
+
+Пока выключатель открыт, fan-out и водопад пропускают сайт сразу
+(fanout.race_sites(skip=retry.is_open)), а не ждут таймаут на каждой позиции.
+
+    retry = RetryPolicy()
+    resp = await retry.run("chipdip.ru", lambda: get(url), retry_if=lambda r: r.status in (429, 500))
+    retry.is_open("chipdip.ru")
+    print(retry.stats())
+
+Ключ — имя сайта или хост: у каждого ключа свой выключатель и свой бюджет.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+RETRYABLE_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitOpenError(Exception):
+    """Выключатель сайта открыт — запрос не выполнялся."""
+
+    def __init__(self, key: str, retry_in: float):
+        super().__init__(f"{key}: выключатель открыт, повтор через {retry_in:.0f} с")
+        self.key = key
+        self.retry_in = retry_in
+
+
+def decorrelated_jitter(previous: float, base: float, cap: float) -> float:
+    return min(cap, random.uniform(base, previous * 3))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_reset_timeout: float = 600.0):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+
+        self.state = CLOSED
+        self.failures = 0  # отказов подряд
+        self.opened_at = 0.0
+        self.probing = False
+
+        self.opens = 0
+        self.rejected = 0
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def is_open(self) -> bool:
+        """Открыт и пробный запрос ещё рано (или он уже идёт)."""
+        if self.state == OPEN:
+            return self.retry_in() > 0
+        return self.state == HALF_OPEN and self.probing
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос; в half-open пропускает один пробный."""
+        if self.state == OPEN and self.retry_in() <= 0:
+            self.state = HALF_OPEN
+            self.probing = False
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def on_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.probing = False
+        self.reset_timeout = self.base_reset_timeout
+
+    def on_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+            self._open()
+        elif self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def on_cancel(self):
+        # отменённый пробный запрос (fan-out нашёл цену раньше) ничего не говорит о сайте
+        self.probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probing = False
+        self.opens += 1
+
+
+class RetryBudget:
+    def __init__(self, ratio: float = 0.2, initial: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.tokens = initial
+        self.max_tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class _KeyStats:
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failed = 0
+        self.budget_exhausted = 0
+
+
+class RetryPolicy:
+    def __init__(self, attempts: int = 3, base_delay: float = 0.5, max_delay: float = 10.0,
+                 budget_ratio: float = 0.2, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, max_reset_timeout: float = 600.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.breaker_args = dict(failure_threshold=failure_threshold, reset_timeout=reset_timeout,
+                                 max_reset_timeout=max_reset_timeout)
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.budgets: Dict[str, RetryBudget] = {}
+        self._stats: Dict[str, _KeyStats] = {}
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        br = self.breakers.get(key)
+        if br is None:
+            br = self.breakers[key] = CircuitBreaker(**self.breaker_args)
+            self.budgets[key] = RetryBudget(self.budget_ratio)
+            self._stats[key] = _KeyStats()
+        return br
+
+    def is_open(self, key: str) -> bool:
+        br = self.breakers.get(key)
+        return br is not None and br.is_open()
+
+    async def run(self, key: str, attempt: Callable[[], Awaitable[Any]],
+                  retry_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Выполняет attempt() с повторами. Отказ — исключение или retry_if(результат).
+        После последней попытки исключение пробрасывается, а результат с retry_if
+        возвращается как есть. CircuitOpenError — если выключатель открыт.
+        """
+        br = self.breaker(key)
+        budget, st = self.budgets[key], self._stats[key]
+        if not br.allow():
+            raise CircuitOpenError(key, br.retry_in())
+        st.calls += 1
+        budget.deposit()
+
+        delay = self.base_delay
+        for n in range(1, self.attempts + 1):
+            error = None
+            try:
+                result = await attempt()
+            except asyncio.CancelledError:
+                br.on_cancel()
+                raise
+            except Exception as e:
+                error, result = e, None
+            if error is None and not (retry_if and retry_if(result)):
+                br.on_success()
+                return result
+
+            br.on_failure()
+            if n == self.attempts:
+                break
+            if not budget.withdraw():
+                st.budget_exhausted += 1
+                break
+            if br.state == OPEN:
+                break
+            st.retries += 1
+            delay = decorrelated_jitter(delay, self.base_delay, self.max_delay)
+            await asyncio.sleep(delay)
+
+        st.failed += 1
+        if error is not None:
+            raise error
+        return result
+
+    def stats(self) -> str:
+        lines = []
+        for key, br in sorted(self.breakers.items()):
+            st = self._stats[key]
+            lines.append(f"{key}: {br.state}, вызовов {st.calls}, повторов {st.retries}, "
+                         f"неудач {st.failed}, отклонено выключателем {br.rejected}, "
+                         f"открывался {br.opens} раз, бюджет исчерпан {st.budget_exhausted}")
+        return "\n".join(lines)
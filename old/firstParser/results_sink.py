@@ -0,0 +1,155 @@
+"""
+results_sink.py
+
+Журналируемая запись результатов вместо перезаписи всего CSV.
+
+Строки дописываются в журнал <output>.journal (append-only, без заголовка).
+Контрольная точка — flush + fsync журнала — делается каждые N строк
+или каждые T секунд, смотря что наступит раньше. Итоговый CSV собирается
+в конце: заголовок + журнал пишутся во временный файл рядом с output,
+который атомарно переименовывается поверх (os.replace), так что падение
+посреди записи не портит ни журнал, ни предыдущий output.
+
+При повторном запуске журнал подхватывается: done содержит ключи
+(первая колонка) уже записанных строк. Недописанный хвост журнала
+(обрыв посреди строки) отрезается. Журнал остаётся только от прерванного
+запуска; завершённый запуск его удаляет, и следующий начинается заново —
+повторный прогон заново собирает цены. С resume_from_output=True (так
+работает score2Async) при отсутствии журнала он один раз заполняется
+из output прошлого запуска, и уже записанные строки пропускаются.
+
+С store_dir журнал при сборке ещё и пишется отдельным прогоном
+в колоночное хранилище (results_store.py, Parquet) — оттуда его читают
+дашборды и сравнение цен между прогонами.
+"""
+
+import csv
+import os
+import tempfile
+import time
+from typing import Iterable, Optional, Sequence, Set
+
+
+class ResultSink:
+    def __init__(self, path: str, header: Sequence[str],
+                 checkpoint_rows: int = 500, checkpoint_seconds: float = 30.0,
+                 store_dir: Optional[str] = None, resume_from_output: bool = False):
+        self.path = path
+        self.resume_from_output = resume_from_output
+        self.store_dir = store_dir
+        self.run_path: Optional[str] = None
+        self.journal_path = path + ".journal"
+        self.header = list(header)
+        self.checkpoint_rows = checkpoint_rows
+        self.checkpoint_seconds = checkpoint_seconds
+
+        self.done: Set[str] = set()
+        self.rows = 0
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._finalized = False
+
+        self._recover()
+        self._file = open(self.journal_path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+
+    # ---------- восстановление ----------
+    def _recover(self):
+        if (self.resume_from_output and not os.path.exists(self.journal_path)
+                and os.path.exists(self.path)):
+            self._seed_from_output()
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, "rb+") as f:
+            data = f.read()
+            tail = data.rfind(b"\n") + 1
+            if tail != len(data):
+                f.truncate(tail)
+                data = data[:tail]
+
+        for row in csv.reader(data.decode("utf-8").splitlines()):
+            if row:
+                self.done.add(row[0])
+                self.rows += 1
+
+    def _seed_from_output(self):
+        with open(self.path, newline="", encoding="utf-8") as src, \
+                open(self.journal_path, "w", newline="", encoding="utf-8") as dst:
+            reader = csv.reader(src)
+            next(reader, None)  # заголовок
+            csv.writer(dst).writerows(row for row in reader if row)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+    # ---------- запись ----------
+    def append(self, row: Sequence) -> bool:
+        """Дописывает строку; возвращает True, если сработала контрольная точка."""
+        self._writer.writerow(row)
+        self.done.add(str(row[0]))
+        self.rows += 1
+        self._pending += 1
+        if (self._pending >= self.checkpoint_rows
+                or time.monotonic() - self._last_sync >= self.checkpoint_seconds):
+            self.checkpoint()
+            return True
+        return False
+
+    def extend(self, rows: Iterable[Sequence]):
+        for row in rows:
+            self.append(row)
+
+    def checkpoint(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    # ---------- завершение ----------
+    def finalize(self, remove_journal: bool = True):
+        """Атомарно собирает output: заголовок + журнал → temp → rename (и прогон в store_dir)."""
+        self.checkpoint()
+        if self.store_dir:
+            import results_store  # pyarrow нужен только при store_dir
+            with open(self.journal_path, newline="", encoding="utf-8") as journal:
+                self.run_path = results_store.write_run(self.store_dir, self.header,
+                                                            (row for row in csv.reader(journal) if row))
+        out_dir = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".csv", dir=out_dir)
+        try:
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as tmp:
+                csv.writer(tmp).writerow(self.header)
+                with open(self.journal_path, newline="", encoding="utf-8") as journal:
+                    while True:
+                        chunk = journal.read(1 << 20)
+                        if not chunk:
+                            break
+                        tmp.write(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.chmod(tmp_path, 0o644)  # mkstemp создаёт файл с правами 0600
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._finalized = True
+        if remove_journal:
+            self.close()
+            os.remove(self.journal_path)
+
+    def close(self):
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # при ошибке output не трогаем — журнал остаётся для продолжения
+        if exc_type is None and not self._finalized:
+            self.finalize()
+        else:
+            self.close()
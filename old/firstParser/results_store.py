@@ -0,0 +1,176 @@
+"""
+results_store.py
+
+Колоночное хранилище результатов прогонов (Parquet / Arrow IPC на pyarrow).
+
+CSV и XLSX медленно пишутся и ещё медленнее читаются обратно: дашборд
+на каждом обновлении заново разбирает текст, а цены и score приходят
+строками. Здесь каждый прогон — отдельный раздел набора данных:
+
+    results/run=20261017T093000123456/part-0.parquet
+
+с типизированными колонками (price_rub — float64, match_score — int16,
+source_site — словарь). Последний прогон или разница цен между двумя
+прогонами читаются за миллисекунды; CSV/XLSX — только экспорт в конце.
+
+    path = write_run("results", OUTPUT_HEADER, rows)     # rows — кортежи как в CSV
+    table = load("results")                              # последний прогон, pyarrow.Table
+    df = price_diff("results")                           # два последних прогона → pandas
+    export_csv(table, "output.csv")
+
+    python results_store.py results            # список прогонов
+    python results_store.py results diff       # изменения цен между двумя последними
+"""
+
+import os
+import sys
+import time
+from typing import Iterable, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+RUN_PREFIX = "run="
+FORMATS = {"parquet": "part-0.parquet", "arrow": "part-0.arrow"}
+
+# типы известных колонок; остальные — строки
+COLUMN_TYPES = {
+    "price_rub": pa.float64(),
+    "match_score": pa.int16(),
+    "source_site": pa.dictionary(pa.int8(), pa.string()),
+}
+
+
+def new_run_id() -> str:
+    # с микросекундами: два прогона за одну секунду не делят раздел;
+    # старые id без них (20261017T093000) сортируются вместе с новыми правильно
+    now = time.time()
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"{int(now % 1 * 1e6):06d}"
+
+
+def schema_for(header: Sequence[str]) -> pa.Schema:
+    return pa.schema([(name, COLUMN_TYPES.get(name, pa.string())) for name in header])
+
+
+def _convert(value, type_: pa.DataType):
+    if value is None or value == "":
+        return None
+    if pa.types.is_floating(type_):
+        return float(value)
+    if pa.types.is_integer(type_):
+        return int(float(value))
+    return str(value)
+
+
+def to_table(header: Sequence[str], rows: Iterable[Sequence]) -> pa.Table:
+    """Строки в виде кортежей (значения могут быть строками из CSV-журнала) → типизированная таблица."""
+    schema = schema_for(header)
+    columns: List[list] = [[] for _ in header]
+    for row in rows:
+        for col, field, value in zip(columns, schema, row):
+            col.append(_convert(value, field.type))
+    return pa.Table.from_arrays(
+        [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema)
+
+
+def write_run(base_dir: str, header: Sequence[str], rows: Iterable[Sequence],
+              run_id: Optional[str] = None, fmt: str = "parquet") -> str:
+    """
+    Пишет прогон в отдельный раздел base_dir/run=<id>/ атомарно; возвращает путь к файлу.
+    Существующий раздел не перезаписывается: для явного run_id — FileExistsError,
+    для сгенерированного берётся следующий id.
+    """
+    table = to_table(header, rows)
+    os.makedirs(base_dir, exist_ok=True)
+    while True:
+        run_dir = os.path.join(base_dir, RUN_PREFIX + (run_id or new_run_id()))
+        try:
+            os.mkdir(run_dir)
+            break
+        except FileExistsError:
+            if run_id:
+                raise
+    path = os.path.join(run_dir, FORMATS[fmt])
+    tmp_path = path + ".tmp"
+    if fmt == "parquet":
+        pq.write_table(table, tmp_path, compression="zstd")
+    else:
+        feather.write_feather(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+    return path
+
+
+def runs(base_dir: str) -> List[str]:
+    """Идентификаторы прогонов по возрастанию (они же — время UTC)."""
+    if not os.path.isdir(base_dir):
+        return []
+    return sorted(name[len(RUN_PREFIX):] for name in os.listdir(base_dir)
+                  if name.startswith(RUN_PREFIX) and _run_file(base_dir, name[len(RUN_PREFIX):]))
+
+
+def _run_file(base_dir: str, run_id: str) -> Optional[str]:
+    for name in FORMATS.values():
+        path = os.path.join(base_dir, RUN_PREFIX + run_id, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def load(base_dir: str, run_id: Optional[str] = None, columns: Optional[Sequence[str]] = None) -> Optional[pa.Table]:
+    """Прогон run_id (по умолчанию — последний) или None, если прогонов нет."""
+    if run_id is None:
+        all_runs = runs(base_dir)
+        if not all_runs:
+            return None
+        run_id = all_runs[-1]
+    path = _run_file(base_dir, run_id)
+    if path is None:
+        return None
+    if path.endswith(".parquet"):
+        return pq.read_table(path, columns=columns)
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def price_diff(base_dir: str, old_run: Optional[str] = None, new_run: Optional[str] = None):
+    """
+    Позиции, у которых цена изменилась между прогонами (по умолчанию — два последних), pandas.
+    Повторы позиции в прогоне (одинаковые строки source.csv) сравниваются один раз — по первой.
+    """
+    all_runs = runs(base_dir)
+    if new_run is None:
+        new_run = all_runs[-1] if all_runs else None
+    if old_run is None:
+        older = [r for r in all_runs if new_run is None or r < new_run]
+        old_run = older[-1] if older else None
+    if old_run is None or new_run is None:
+        return None
+    cols = ["item", "price_rub", "source_site"]
+    old = load(base_dir, old_run, cols).to_pandas().drop_duplicates("item")
+    new = load(base_dir, new_run, cols).to_pandas().drop_duplicates("item")
+    merged = old.merge(new, on="item", how="outer", suffixes=("_old", "_new"))
+    merged["delta"] = merged["price_rub_new"] - merged["price_rub_old"]
+    changed = merged["price_rub_old"].ne(merged["price_rub_new"])
+    changed &= merged["price_rub_old"].notna() | merged["price_rub_new"].notna()
+    return merged[changed].sort_values("delta", key=abs, ascending=False, na_position="last")
+
+
+# ---------- экспорт ----------
+def export_csv(table: pa.Table, path: str):
+    table.to_pandas().to_csv(path, index=False, encoding="utf-8")
+
+
+def export_xlsx(table: pa.Table, path: str):
+    table.to_pandas().to_excel(path, index=False)
+
+
+if __name__ == "__main__":
+    base = sys.argv[1] if len(sys.argv) > 1 else "results"
+    if len(sys.argv) > 2 and sys.argv[2] == "diff":
+        diff = price_diff(base)
+        print("Нужно минимум два прогона" if diff is None else diff.to_string(index=False))
+    else:
+        for run in runs(base):
+            t0 = time.perf_counter()
+            table = load(base, run)
+            print(f"{run}: {table.num_rows} строк, чтение {(time.perf_counter() - t0) * 1000:.1f} мс")
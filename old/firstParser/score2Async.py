@@ -1,13 +1,24 @@
 import asyncio
 import aiohttp
-import csv
-from bs4 import BeautifulSoup
 from rapidfuzz import fuzz
 import sys
-import os
 import logging
 from tqdm import tqdm
-import re
+import json
+
+from fanout import race_sites
+from pipeline import run_pipeline, format_stats
+from results_sink import ResultSink
+from lookup_cache import LookupCache
+from http_fetch import ValidatorStore, fetch_async
+from http_session import ConnectionStats, create_session
+from ratelimit import AsyncRateLimiter, host_of
+from resilience import RetryPolicy, CircuitOpenError, RETRYABLE_STATUSES
+from parse_pool import ParsePool
+from extractors import extract_products
+from fuzzy_rank import Candidates, normalize
+import source_grammar
+from query_plan import QueryPlan
 
 # ----------- Настройки -----------
 HEADERS = {
@@ -17,25 +28,59 @@ HEADERS = {
     "Referer": "https://www.google.com/",
     "Connection": "keep-alive"
 }
-BATCH_SIZE = 100
-SAVE_EVERY = 500
+FETCH_WORKERS = 20   # позиций в работе одновременно (каждая — до 4 запросов)
+PARSE_WORKERS = 1
+PARSE_PROCESSES = None  # процессов разбора HTML: None — по числу ядер, 0 — без пула
+QUEUE_SIZE = 200     # ёмкость очередей между стадиями конвейера
+SAVE_EVERY = 500          # контрольная точка (fsync журнала) каждые N строк...
+CHECKPOINT_SECONDS = 30   # ...или каждые T секунд
+OUTPUT_HEADER = ["item", "price_rub", "source_site", "source_url", "match_score"]
+RESULTS_DIR = "results"   # прогоны в Parquet (results_store.py); None — только CSV
+MIN_SCORE = 70
 TIMEOUT = 20
 SEM_LIMIT = 10
+HOST_LIMITS = dict(rate=2.0, max_rate=10.0, limit=2, max_limit=8)  # старт/потолок на хост, см. ratelimit.py
+RETRY = dict(attempts=3, base_delay=0.5, max_delay=8.0,   # повторы и выключатели на сайт, см. resilience.py
+             failure_threshold=5, reset_timeout=30.0)
+SEARCH_MODE = "ordered"  # "first" | "ordered" — см. fanout.py
 LOG_FILE = "errors.log"
+CACHE_DB = "lookup_cache.db"
+HTTP_CACHE_DB = "http_cache.db"
+CACHE_TTL = {  # сек
+    "chipdip.ru": 3 * 24 * 3600,
+    "laserparts.ru": 7 * 24 * 3600,
+    "tze1.ru": 7 * 24 * 3600,
+    "zipzip.ru": 7 * 24 * 3600,
+}
 # ---------------------------------
 
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.WARNING,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    encoding="utf-8"
-)
-
-sem = asyncio.Semaphore(SEM_LIMIT)
-
-
-def normalize(s: str) -> str:
-    return s.lower().replace("-", "").replace(" ", "")
+# Логирование, кэши, лимитеры и пул настраивает init_resources() из process_items,
+# а не импорт: процессы разбора (spawn) заново импортируют этот файл как __mp_main__,
+# и открывать в каждом из них errors.log, базы и лимитеры незачем.
+sem: asyncio.Semaphore
+lookup_cache: LookupCache
+validators: ValidatorStore
+limiter: AsyncRateLimiter
+conn_stats: ConnectionStats
+retry: RetryPolicy
+parse_pool: ParsePool
+
+
+def init_resources():
+    global sem, lookup_cache, validators, limiter, conn_stats, retry, parse_pool
+    logging.basicConfig(
+        filename=LOG_FILE,
+        level=logging.WARNING,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        encoding="utf-8"
+    )
+    sem = asyncio.Semaphore(SEM_LIMIT)
+    lookup_cache = LookupCache(CACHE_DB, ttl=CACHE_TTL)
+    validators = ValidatorStore(HTTP_CACHE_DB)
+    limiter = AsyncRateLimiter(**HOST_LIMITS)
+    conn_stats = ConnectionStats()
+    retry = RetryPolicy(**RETRY)
+    parse_pool = ParsePool(PARSE_PROCESSES)
 
 
 def match_score(q: str, f: str) -> int:
@@ -44,26 +89,44 @@ def match_score(q: str, f: str) -> int:
     return fuzz.ratio(normalize(q), normalize(f))
 
 
-def extract_article(text: str) -> str:
-    """Извлекает артикул (последовательность букв+цифр от 6 символов)"""
-    match = re.search(r"[A-Za-z0-9]{6,}", text)
-    return match.group(0) if match else ""
-
-
 # ---------- HTTP ----------
-async def fetch(session: aiohttp.ClientSession, url: str, is_json=False):
-    async with sem:
+async def fetch(session: aiohttp.ClientSession, url: str, is_json=False, cache_key=None):
+    """cache_key=(site, item) — ответ берётся из постоянного кэша и кладётся в него."""
+    body = lookup_cache.get(*cache_key) if cache_key else None
+    fresh = body is None
+    if fresh:
+        body = await _download(session, url, cache_key[0] if cache_key else host_of(url))
+        if body is None:
+            return None
+    result = body
+    if is_json:
         try:
-            async with session.get(url, timeout=TIMEOUT) as resp:
-                if resp.status == 200:
-                    if is_json:
-                        return await resp.json(content_type=None)
-                    return await resp.text()
-                else:
-                    logging.warning(f"Ошибка {resp.status} при запросе {url}")
-        except Exception as e:
-            logging.warning(f"Ошибка запроса {url}: {e}")
+            result = json.loads(body)
+        except ValueError as e:
+            logging.warning(f"Некорректный JSON от {url}: {e}")
             return None
+    if fresh and cache_key:
+        lookup_cache.put(*cache_key, body)
+    return result
+
+
+async def _download(session: aiohttp.ClientSession, url: str, site: str):
+    async def attempt():
+        async with limiter.slot(url) as slot, sem:
+            resp = await fetch_async(session, url, validators, timeout=TIMEOUT)
+            slot.record(resp.status_code, resp.headers.get("Retry-After"))
+            return resp
+
+    try:
+        resp = await retry.run(site, attempt, retry_if=lambda r: r.status_code in RETRYABLE_STATUSES)
+    except CircuitOpenError:
+        return None  # сайт лежит — не ждём таймаут, см. retry.stats()
+    except Exception as e:
+        logging.warning(f"Ошибка запроса {url}: {e}")
+        return None
+    if resp.status_code == 200:
+        return resp.text
+    logging.warning(f"Ошибка {resp.status_code} при запросе {url}")
     return None
 # --------------------------
 
@@ -71,188 +134,177 @@ async def fetch(session: aiohttp.ClientSession, url: str, is_json=False):
 # ---------- Chipdip API ----------
 async def search_chipdip_api(session, item: str):
     url = f"https://www.chipdip.ru/ajaxsearch?searchtext={item}"
-    data = await fetch(session, url, is_json=True)
+    data = await fetch(session, url, is_json=True, cache_key=("chipdip.ru", item))
     if not data or "items" not in data or not data["items"]:
         return None
 
-    article = extract_article(item)
-    best = None
-    best_score = 0
-
+    products = []
     for prod in data["items"]:
-        found_name = prod.get("Name", "").strip()
-        prod_url = "https://www.chipdip.ru" + prod.get("Url", "")
         try:
             price_val = float(str(prod.get("Price", "0")).replace(",", "."))
         except Exception:
             continue
-
-        if article and article.lower() in found_name.lower():
-            return price_val, "chipdip.ru", prod_url, found_name
-
-        score = match_score(item, found_name)
-        if score > best_score:
-            best_score = score
-            best = (price_val, "chipdip.ru", prod_url, found_name)
-
-    return best
+        products.append((prod.get("Name", "").strip(), price_val, "https://www.chipdip.ru" + prod.get("Url", "")))
+    return pick_best_product(products, item, "chipdip.ru", url)
 # ---------------------------------
 
 
 # ---------- Общая логика для HTML сайтов ----------
 def pick_best_product(products, item: str, site: str, base_url: str):
-    article = extract_article(item)
-    best = None
-    best_score = 0
-
-    for name, price, url in products:
-        if not name or not price:
-            continue
-
-        if article and article.lower() in name.lower():
-            return price, site, url, name
-
-        score = match_score(item, name)
-        if score > best_score:
-            best_score = score
-            best = (price, site, url, name)
-
-    return best
+    """Совпадение по артикулу, иначе лучший fuzz.ratio по всем карточкам сразу (fuzzy_rank)."""
+    products = [p for p in products if p[0] and p[1]]
+    rec = source_grammar.parse_line(item)
+    articles = [k for k in map(source_grammar.article_key, rec.articles) if len(k) >= 5]
+    if articles:
+        for name, price, url in products:
+            name_key = source_grammar.article_key(name)
+            if any(a in name_key for a in articles):
+                return price, site, url, name
+
+    found = Candidates([name for name, _, _ in products]).best(item)
+    if found is None:
+        return None
+    name, price, url = products[found[0]]
+    return price, site, url, name
 # ---------------------------------
 
 
 # ---------- Остальные сайты ----------
 async def search_laserparts(session, item: str):
     url = f"https://www.laserparts.ru/search?query={item}"
-    html = await fetch(session, url)
+    html = await fetch(session, url, cache_key=("laserparts.ru", item))
     if not html:
         return None
-    soup = BeautifulSoup(html, "html.parser")
-    products = []
-    for prod in soup.select(".product-item"):
-        name = prod.select_one(".product-title")
-        price = prod.select_one(".price")
-        if name and price:
-            try:
-                price_val = float(price.text.strip().split()[0].replace(",", "."))
-            except Exception:
-                continue
-            products.append((name.text.strip(), price_val, url))
+    products = await parse_pool.run(extract_products, html, url, ".product-item", ".product-title", ".price")
     return pick_best_product(products, item, "laserparts.ru", url)
 
 
 async def search_tze1(session, item: str):
     url = f"https://tze1.ru/search?search={item}"
-    html = await fetch(session, url)
+    html = await fetch(session, url, cache_key=("tze1.ru", item))
     if not html:
         return None
-    soup = BeautifulSoup(html, "html.parser")
-    products = []
-    for prod in soup.select(".product-thumb"):
-        name = prod.select_one(".caption a")
-        price = prod.select_one(".price")
-        if name and price:
-            try:
-                price_val = float(price.text.strip().split()[0].replace(",", "."))
-            except Exception:
-                continue
-            products.append((name.text.strip(), price_val, url))
+    products = await parse_pool.run(extract_products, html, url, ".product-thumb", ".caption a", ".price")
     return pick_best_product(products, item, "tze1.ru", url)
 
 
 async def search_zipzip(session, item: str):
     url = f"https://zipzip.ru/search/?q={item}"
-    html = await fetch(session, url)
+    html = await fetch(session, url, cache_key=("zipzip.ru", item))
     if not html:
         return None
-    soup = BeautifulSoup(html, "html.parser")
-    products = []
-    for prod in soup.select(".item_info"):
-        name = prod.select_one(".item-title")
-        price = prod.select_one(".price_value")
-        if name and price:
-            try:
-                price_val = float(price.text.strip().split()[0].replace(",", "."))
-            except Exception:
-                continue
-            products.append((name.text.strip(), price_val, url))
+    products = await parse_pool.run(extract_products, html, url, ".item_info", ".item-title", ".price_value")
     return pick_best_product(products, item, "zipzip.ru", url)
 # --------------------------------------
 
 
-async def find_price_for_item(session, item: str):
-    for search_func in [search_chipdip_api, search_laserparts, search_tze1, search_zipzip]:
-        try:
-            result = await search_func(session, item)
-            if result:
-                price, site, url, found_name = result
-                score = match_score(item, found_name)
-                return price, site, url, found_name, score
-        except Exception as e:
-            logging.warning(f"Ошибка при поиске {item}: {e}")
+# порядок = приоритет сайта
+SEARCH_FUNCS = [
+    ("chipdip.ru", search_chipdip_api),
+    ("laserparts.ru", search_laserparts),
+    ("tze1.ru", search_tze1),
+    ("zipzip.ru", search_zipzip),
+]
+
+
+def _site_jobs(session, item: str):
+    return [(site, lambda f=func: f(session, item)) for site, func in SEARCH_FUNCS]
+
+
+def _log_site_error(item: str):
+    return lambda site, e: logging.warning(f"Ошибка при поиске {item} на {site}: {e}")
+
+
+def _skip_site(item: str):
+    # выключатель открыт — сайт не опрашиваем, если ответа нет в кэше
+    return lambda site: retry.is_open(site) and lookup_cache.get(site, item) is None
+
+
+async def find_price_for_item(session, item: str, mode: str = SEARCH_MODE):
+    hits = await race_sites(_site_jobs(session, item), mode=mode, on_error=_log_site_error(item),
+                            skip=_skip_site(item))
+    if hits:
+        _, (price, site, url, found_name) = hits[0]
+        score = match_score(item, found_name)
+        return price, site, url, found_name, score
     return None, None, None, None, 0
 
 
-def chunked(lst, size):
-    for i in range(0, len(lst), size):
-        yield lst[i:i + size]
+async def find_offers_for_item(session, item: str):
+    """Все предложения по позиции (price, site, url, found_name, score) в порядке приоритета сайтов."""
+    hits = await race_sites(_site_jobs(session, item), mode="all", on_error=_log_site_error(item),
+                            skip=_skip_site(item))
+    offers = []
+    for _, (price, site, url, found_name) in hits:
+        offers.append((price, site, url, found_name, match_score(item, found_name)))
+    return offers
+
+
+def build_row(item: str, found):
+    """Стадия parse: отбор по score и форматирование строки результата."""
+    price, site, url, name, score = found or (None, None, None, None, 0)
+    if not price or score < MIN_SCORE:
+        logging.warning(f"Не найдено: {item} (score={score})")
+        return None
+    return item, f"{price:.2f}", site, url, score
+
+
+def build_rows(lines, found):
+    """Один найденный товар → строки результата для ещё не записанных строк source.csv этого запроса."""
+    price, site, url, name, _ = found or (None, None, None, None, 0)
+    return [(line, build_row(line, (price, site, url, name, match_score(line, name))))
+            for line in lines]
 
 
 async def process_items(input_file: str, output_file: str):
-    with open(input_file, newline="", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        items = [row[0].strip() for row in reader if row]
-
-    processed = set()
-    results = []
-
-    if os.path.exists(output_file):
-        with open(output_file, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    item = row.get("item", "").strip()
-                    if item:
-                        processed.add(item)
-                        results.append((
-                            item,
-                            row.get("price_rub", ""),
-                            row.get("source_site", ""),
-                            row.get("source_url", ""),
-                            row.get("match_score", "0")
-                        ))
-                except Exception as e:
-                    logging.warning(f"Ошибка чтения строки {row}: {e}")
-        print(f"🔄 Продолжаем с места остановки. Уже обработано: {len(processed)} строк")
-
-    remaining_items = [it for it in items if it not in processed]
-
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        with tqdm(total=len(remaining_items), desc="Обработка", unit="шт") as pbar:
-            for idx, batch in enumerate(chunked(remaining_items, BATCH_SIZE), 1):
-                tasks = [find_price_for_item(session, item) for item in batch]
-                batch_results = await asyncio.gather(*tasks)
-
-                for item, (price, site, url, name, score) in zip(batch, batch_results):
-                    if not price or score < 70:
-                        logging.warning(f"Не найдено: {item} (score={score})")
-                    else:
-                        results.append((item, f"{price:.2f}", site, url, score))
-                    pbar.update(1)
-
-                if len(results) % SAVE_EVERY == 0:
-                    with open(output_file, "w", newline="", encoding="utf-8") as f:
-                        writer = csv.writer(f)
-                        writer.writerow(["item", "price_rub", "source_site", "source_url", "match_score"])
-                        writer.writerows(results)
-                    print(f"--- Сохранено промежуточно: {len(results)} строк")
-
-    with open(output_file, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["item", "price_rub", "source_site", "source_url", "match_score"])
-        writer.writerows(results)
-
-    print(f"✅ Готово. Всего записано: {len(results)} строк → {output_file}")
+    init_resources()
+    # разбор строк (артикулы) кэшируется рядом с CSV — source_grammar.py;
+    # строки с одним товаром ищутся одним запросом — query_plan.py
+    plan = QueryPlan(source_grammar.load(input_file))
+    print(plan.report())
+
+    sink = ResultSink(output_file, OUTPUT_HEADER,
+                      checkpoint_rows=SAVE_EVERY, checkpoint_seconds=CHECKPOINT_SECONDS,
+                      store_dir=RESULTS_DIR, resume_from_output=True)
+    if sink.rows:
+        print(f"🔄 Продолжаем с места остановки. Уже обработано: {len(sink.done)} строк")
+
+    # строки, уже записанные в прошлых запусках, не пишутся повторно;
+    # отбор делается один раз до старта — sink.done пополняется по ходу прогона
+    pending = {q: [line for line in plan.lines_for(q) if line not in sink.done] for q in plan.queries}
+    remaining_queries = [q for q, lines in pending.items() if lines]
+
+    with sink, parse_pool:
+        async with create_session(HEADERS, stats=conn_stats) as session:
+            total = sum(len(pending[q]) for q in remaining_queries)
+            with tqdm(total=total, desc="Обработка", unit="шт") as pbar:
+                def write_rows(query, rows):
+                    for line, row in rows or [(line, None) for line in pending[query]]:
+                        if row and sink.append(row):
+                            pbar.write(f"--- Сохранено промежуточно: {sink.rows} строк")
+                        pbar.update(1)
+
+                stats = await run_pipeline(
+                    remaining_queries,
+                    fetch=lambda query: find_price_for_item(session, query),
+                    parse=lambda query, found: build_rows(pending[query], found),
+                    write=write_rows,
+                    fetch_workers=FETCH_WORKERS,
+                    parse_workers=PARSE_WORKERS,
+                    queue_size=QUEUE_SIZE,
+                )
+
+    print(format_stats(stats))
+    print(f"Кэш ответов: {lookup_cache.stats()}")
+    print(f"HTTP: {validators.stats()}")
+    print(limiter.stats())
+    print(conn_stats.report())
+    print(retry.stats())
+    print(parse_pool.stats())
+
+    print(f"✅ Готово. Всего записано: {sink.rows} строк → {output_file}")
+    if sink.run_path:
+        print(f"📦 Прогон для анализа: {sink.run_path}")
     print(f"⚠️ Ошибки смотри в {LOG_FILE}")
 
 
@@ -1,9 +1,13 @@
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-from time import sleep
 from tqdm import tqdm
 
+import html_extract as hx
+from ratelimit import RateLimiter
+
+# темп запросов подстраивается под ответы сайта вместо фиксированной паузы
+limiter = RateLimiter(rate=1.0, min_rate=0.2, max_rate=4.0)
+
 # --- Функция запроса и парсинга ---
 def fetch_part_results(part, url, headers, cookies):
     data = {
@@ -16,22 +20,24 @@ def fetch_part_results(part, url, headers, cookies):
 
     results = []
     try:
-        response = requests.post(url, headers=headers, cookies=cookies, data=data, timeout=10)
+        with limiter.slot(url) as slot:
+            response = requests.post(url, headers=headers, cookies=cookies, data=data, timeout=10)
+            slot.record(response.status_code, response.headers.get("Retry-After"))
         if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
+            doc = hx.parse(response.text)
             
             # Находим все блоки товаров
-            items = soup.select("div.product")
+            items = hx.select(doc, "div.product")
             if not items:
                 results.append({"part": part, "name": None, "price": None})
             for item in items:
                 # Название
-                name_tag = item.select_one("div.name a")
-                name = name_tag.get_text(strip=True) if name_tag else None
+                name_tag = hx.select_one(item, "div.name a")
+                name = hx.text(name_tag, "") if name_tag is not None else None
                 
                 # Цена
-                price_tag = item.select_one("div.jshop_price span")
-                price = price_tag.get_text(strip=True) if price_tag else None
+                price_tag = hx.select_one(item, "div.jshop_price span")
+                price = hx.text(price_tag, "") if price_tag is not None else None
                 
                 results.append({"part": part, "name": name, "price": price})
         else:
@@ -69,11 +75,11 @@ def main():
     for part in tqdm(df["part_name"], desc="Обработка деталей"):
         part_results = fetch_part_results(part, url, headers, cookies)
         all_results.extend(part_results)
-        sleep(1)  # задержка, чтобы не заблокировали сайт
 
     output_df = pd.DataFrame(all_results)
     output_df.to_csv(output_csv, index=False)
     print(f"Поиск завершён, результаты сохранены в {output_csv}")
+    print(limiter.stats())
 
 if __name__ == "__main__":
     main()
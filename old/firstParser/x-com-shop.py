@@ -10,20 +10,24 @@
 - переходит по этой ссылке и пытается найти цену товара (по артикулам -> по a/b)
 - сохраняет результат в result.csv и логирует в parser.log
 
-pip install requests beautifulsoup4 rapidfuzz
+pip install requests lxml cssselect rapidfuzz numpy
 """
 
 import csv
 import re
-import time
 import random
 import logging
 from typing import List, Tuple, Optional, Dict
 from urllib.parse import quote_plus, urljoin, urlparse, parse_qs
 
 import requests
-from bs4 import BeautifulSoup
-from rapidfuzz import fuzz
+
+import html_extract as hx
+import prices
+from article_match import ArticleMatcher
+from fuzzy_rank import Candidates
+import source_grammar
+from ratelimit import RateLimiter
 
 # ----------------------------
 # Настройки
@@ -39,11 +43,16 @@ USER_AGENTS = [
 ]
 
 REQUEST_TIMEOUT = 12  # секунд
-PAUSE_MIN = 3.0
-PAUSE_MAX = 7.0
+# темп по хостам (ratelimit.py): Google держим на ~1 запросе в 5 с, как прежняя пауза 3–7 с
+HOST_LIMITS = dict(rate=0.5, min_rate=0.1, max_rate=2.0, rate_step=0.1)
+GOOGLE_LIMITS = dict(rate=0.2, min_rate=0.05, max_rate=0.3, rate_step=0.02, burst=1.0)
+
+limiter = RateLimiter(per_host={"www.google.com": GOOGLE_LIMITS}, **HOST_LIMITS)
 
-PRICE_REGEX = re.compile(r"(\d{1,3}(?:[ \u00A0]\d{3})*(?:[.,]\d{2})?)\s?(?:₽|руб|RUB|rub)", re.IGNORECASE)
-ARTICLES_END_RE = re.compile(r"((?:[A-Za-z0-9\-]+)(?:/[A-Za-z0-9\-]+)*)\s*$")
+ARTICLE_WINDOW = 500  # цена должна быть не дальше N символов от артикула
+NAME_MIN_SCORE = 65   # минимальный fuzz.ratio блока текста с названием позиции
+NAME_TOP_K = 5        # сколько лучших по названию блоков проверять на цену
+NAME_PRICE_WINDOW = 6 # цена ищется в блоке с названием и в N следующих (название и цена — разные узлы)
 
 # ----------------------------
 # Логирование
@@ -69,15 +78,8 @@ def log(msg: str, level: str = "info"):
 # CSV I/O
 # ----------------------------
 def read_input(filepath: str) -> List[str]:
-    items = []
-    with open(filepath, newline="", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if not row:
-                continue
-            val = row[0].strip()
-            # allow empty lines but skip pure-empty
-            items.append(val)
+    # разбор строк кэшируется рядом с CSV (source_grammar.py)
+    items = [rec.line for rec in source_grammar.load(filepath)]
     log(f"Прочитано {len(items)} строк из {filepath}")
     return items
 
@@ -104,18 +106,10 @@ def normalize_text(s: Optional[str]) -> str:
     return s.strip()
 
 def parse_expression(text: str) -> Tuple[str, str, List[str]]:
-    text = text.strip()
-    articles: List[str] = []
-    m = ARTICLES_END_RE.search(text)
-    if m:
-        maybe = m.group(1)
-        if re.search(r"[A-Za-z0-9\-]", maybe):
-            articles = [x.strip() for x in maybe.split("/") if x.strip()]
-            text = text[:m.start()].strip()
-    parts = text.split(maxsplit=1)
-    a = parts[0].strip() if parts else ""
-    b = parts[1].strip() if len(parts) > 1 else ""
-    return normalize_text(a), normalize_text(b), articles
+    """a — количество/формат, b — описание и бренд, articles — артикулы (source_grammar)."""
+    rec = source_grammar.parse_line(text)
+    b = " ".join(filter(None, [rec.description, rec.brand]))
+    return normalize_text(rec.qty), normalize_text(b), list(rec.articles)
 
 # ----------------------------
 # Формируем безопасный Google-запрос и извлекаем первую ссылку
@@ -160,7 +154,9 @@ def safe_google_search(query: str) -> Tuple[Optional[str], Optional[str]]:
     log(f"[GOOGLE] Запрос: {search_url}")
 
     try:
-        resp = requests.get(search_url, headers=headers, timeout=REQUEST_TIMEOUT)
+        with limiter.slot(search_url) as slot:
+            resp = requests.get(search_url, headers=headers, timeout=REQUEST_TIMEOUT)
+            slot.record(resp.status_code, resp.headers.get("Retry-After"))
     except Exception as e:
         log(f"[GOOGLE] Ошибка запроса: {e}", level="error")
         return search_url, None
@@ -169,14 +165,13 @@ def safe_google_search(query: str) -> Tuple[Optional[str], Optional[str]]:
         log(f"[GOOGLE] HTTP {resp.status_code} при запросе: {search_url}", level="warning")
         return search_url, None
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+    doc = hx.parse(resp.text)
     first_link = None
 
     # Strategy 1: new SERP structure - div.yuRUbf > a (often contains the target)
     try:
-        a_tag = soup.select_one("div.yuRUbf > a[href]")
-        if a_tag and a_tag.get("href"):
-            href = a_tag.get("href")
+        href = hx.attr(hx.select_one(doc, "div.yuRUbf > a[href]"), "href")
+        if href:
             target = _extract_target_from_href(href) or href
             first_link = target
     except Exception:
@@ -184,8 +179,8 @@ def safe_google_search(query: str) -> Tuple[Optional[str], Optional[str]]:
 
     # Strategy 2: links in result containers with /url?q=
     if not first_link:
-        for a in soup.find_all("a", href=True):
-            href = a["href"]
+        for a in hx.select(doc, "a[href]"):
+            href = hx.attr(a, "href")
             target = _extract_target_from_href(href)
             if target:
                 # skip google-internal caches and google domains
@@ -198,8 +193,8 @@ def safe_google_search(query: str) -> Tuple[Optional[str], Optional[str]]:
 
     # Strategy 3: fallback to first http(s) link that is not google
     if not first_link:
-        for a in soup.find_all("a", href=True):
-            href = a["href"]
+        for a in hx.select(doc, "a[href]"):
+            href = hx.attr(a, "href")
             if href.startswith("http"):
                 parsed = urlparse(href)
                 hostname = parsed.hostname or ""
@@ -225,7 +220,9 @@ def fetch_page(url: str) -> Optional[requests.Response]:
         "Referer": "https://www.google.com/"
     }
     try:
-        r = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        with limiter.slot(url) as slot:
+            r = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            slot.record(r.status_code, r.headers.get("Retry-After"))
         if r.status_code == 200:
             return r
         else:
@@ -234,85 +231,53 @@ def fetch_page(url: str) -> Optional[requests.Response]:
         log(f"[FETCH] Ошибка при заходе на {url}: {e}", level="error")
     return None
 
-def find_price_in_text_block(text_block: str) -> Optional[str]:
-    if not text_block:
-        return None
-    m = PRICE_REGEX.search(text_block)
-    if m:
-        return m.group(0)
-    return None
-
-def extract_price_from_soup_for_articles(soup: BeautifulSoup, articles: List[str]) -> Tuple[Optional[str], Optional[str]]:
-    page_text = soup.get_text(separator=" ", strip=True)
-    for art in articles:
-        if not art:
-            continue
-        idx = page_text.lower().find(art.lower())
-        if idx != -1:
-            start = max(0, idx - 500)
-            end = min(len(page_text), idx + 500)
-            window = page_text[start:end]
-            price = find_price_in_text_block(window)
-            if price:
-                return price, "article_text"
-    for art in articles:
-        if not art:
-            continue
-        candidates = soup.find_all(string=re.compile(re.escape(art), re.IGNORECASE))
-        for cand in candidates:
-            parent = cand.parent
+def extract_price_from_doc_for_articles(doc, articles: List[str],
+                                        page_text: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    matcher = ArticleMatcher(articles)
+    if not matcher:
+        return None, None
+    # 1) все артикулы за один проход по тексту, цена — ближайшая по смещению
+    near = matcher.nearest_prices(page_text if page_text is not None else hx.text(doc), ARTICLE_WINDOW)
+    for art in matcher.articles:
+        if art in near:
+            return near[art].raw, "article_text"
+    # 2) один обход DOM: поднимаемся от строки с артикулом до 4 уровней вверх
+    nodes = matcher.nodes(doc)
+    for art in matcher.articles:
+        for parent in nodes.get(art, []):
             for _ in range(4):
-                if not parent:
+                if parent is None:
                     break
-                text_block = parent.get_text(" ", strip=True)
-                price = find_price_in_text_block(text_block)
+                text_block = hx.text(parent)
+                price = prices.price_raw(text_block, bare=False)
                 if price:
                     return price, "article_dom"
-                parent = parent.parent
+                parent = hx.parent(parent)
     return None, None
 
-def extract_price_from_soup_for_name(soup: BeautifulSoup, a: str, b: str) -> Tuple[Optional[str], Optional[str]]:
-    page_text = soup.get_text(separator=" ", strip=True)
+def extract_price_from_doc_for_name(doc, a: str, b: str,
+                                    page_text: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    if page_text is None:
+        page_text = hx.text(doc)
     name_target = " ".join(filter(None, [a, b])).strip()
     if not name_target:
-        price = find_price_in_text_block(page_text)
+        price = prices.price_raw(page_text, bare=False)
         if price:
             return price, "any_price_fallback"
         return None, None
-    blocks = re.split(r"[>\n\r\t]+", page_text)
-    best_score = 0
-    best_block = None
-    for block in blocks:
-        if not block.strip():
-            continue
-        score = fuzz.ratio(normalize_text(name_target), normalize_text(block))
-        if score > best_score:
-            best_score = score
-            best_block = block
-    if best_block and best_score >= 65:
-        price = find_price_in_text_block(best_block)
+    # блоки — текстовые узлы страницы: в page_text они склеены пробелами в один блок
+    blocks = [block for block in re.split(r"[>\n\r\t]+", hx.text(doc, "\n")) if block.strip()]
+    ranked = Candidates(blocks, processor=normalize_text).top(name_target, k=NAME_TOP_K,
+                                                              score_cutoff=NAME_MIN_SCORE)
+    for index, score in ranked:
+        price = prices.price_raw(" ".join(blocks[index:index + NAME_PRICE_WINDOW + 1]), bare=False)
         if price:
-            return price, f"name_fuzzy_{int(best_score)}"
-    price = find_price_in_text_block(page_text)
+            return price, f"name_fuzzy_{int(score)}"
+    price = prices.price_raw(page_text, bare=False)
     if price:
         return price, "any_price_fallback"
     return None, None
 
-def parse_price_to_number(price_raw: str) -> Optional[int]:
-    if not price_raw:
-        return None
-    m = re.search(r"([\d \u00A0]+)(?:[.,]\d{2})?", price_raw)
-    if not m:
-        return None
-    digits = m.group(1).replace("\u00A0", "").replace(" ", "")
-    try:
-        return int(digits)
-    except Exception:
-        try:
-            return int(float(digits))
-        except Exception:
-            return None
-
 # ----------------------------
 # Обработка одной строки (гарантированный переход по первой ссылке)
 # ----------------------------
@@ -352,20 +317,21 @@ def process_line(input_line: str) -> Dict:
         log(f"[PROCESS] Не удалось загрузить первую ссылку: {parsed_first}", level="warning")
         return result
 
-    soup = BeautifulSoup(r.text, "html.parser")
+    doc = hx.parse(r.text)
+    page_text = hx.text(doc)
 
     # 1) Попробуем найти цену по артикулам
-    price_raw, matched = extract_price_from_soup_for_articles(soup, articles)
+    price_raw, matched = extract_price_from_doc_for_articles(doc, articles, page_text)
     if price_raw:
-        num = parse_price_to_number(price_raw)
+        num = prices.price_value(price_raw)
         result.update({"price_raw": price_raw, "price_numeric_rub": num if num is not None else "", "matched_by": matched})
         log(f"[FOUND] По article на {parsed_first}: {price_raw} (num={num})")
         return result
 
     # 2) Попробуем найти цену по a+b
-    price_raw, matched = extract_price_from_soup_for_name(soup, a, b)
+    price_raw, matched = extract_price_from_doc_for_name(doc, a, b, page_text)
     if price_raw:
-        num = parse_price_to_number(price_raw)
+        num = prices.price_value(price_raw)
         result.update({"price_raw": price_raw, "price_numeric_rub": num if num is not None else "", "matched_by": matched})
         log(f"[FOUND] По name на {parsed_first}: {price_raw} (num={num}), match={matched}")
         return result
@@ -393,11 +359,9 @@ def main():
                 "a": "", "b": "", "articles": "", "google_query_url": "", "first_link": "",
                 "price_raw": "", "price_numeric_rub": "", "matched_by": "error"
             })
-        sleep_t = random.uniform(PAUSE_MIN, PAUSE_MAX)
-        log(f"Пауза {sleep_t:.2f} с.")
-        time.sleep(sleep_t)
 
     save_results(results, OUTPUT_FILE)
+    log(f"Темп по хостам:\n{limiter.stats()}")
     log("Готово.")
 
 if __name__ == "__main__":
@@ -1,10 +1,14 @@
 import csv
-import aiohttp
 import asyncio
 import logging
+import json
 import os
 from rapidfuzz import fuzz
 
+from lookup_cache import LookupCache
+from http_session import ConnectionStats, create_session
+import results_store
+
 # Логирование ошибок
 logging.basicConfig(filename="errors.log", level=logging.WARNING, encoding="utf-8")
 
@@ -16,6 +20,37 @@ HEADERS = {
     "Connection": "keep-alive",
 }
 
+# Постоянный кэш ответов Chipdip API (data/ смонтирован как volume)
+CACHE_DB = os.path.join("data", "lookup_cache.db")
+CACHE_TTL = {"chipdip.ru": 3 * 24 * 3600}
+
+# Прогоны в Parquet (results_store.py) — их читает ui.py; output.csv — экспорт
+RESULTS_DIR = os.path.join("data", "results")
+OUTPUT_HEADER = ["item", "price_rub", "source_site", "source_url", "match_score"]
+
+os.makedirs(os.path.dirname(CACHE_DB), exist_ok=True)
+lookup_cache = LookupCache(CACHE_DB, ttl=CACHE_TTL)
+conn_stats = ConnectionStats()
+
+
+async def fetch_json(session, url: str, site: str, item: str):
+    """GET с постоянным кэшем по (site, item); None при ошибке или не-200."""
+    body = lookup_cache.get(site, item)
+    if body is None:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                logging.warning(f"{site} вернул {resp.status} для {item}")
+                return None
+            body = await resp.text()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            logging.warning(f"{site}: некорректный JSON для {item}")
+            return None
+        lookup_cache.put(site, item, body)
+        return data
+    return json.loads(body)
+
 
 async def search_chipdip_api(session, item: str):
     """
@@ -24,26 +59,21 @@ async def search_chipdip_api(session, item: str):
     """
     url = f"https://www.chipdip.ru/ajaxsearch?searchtext={item}"
     try:
-        async with session.get(url, headers=HEADERS) as resp:
-            if resp.status != 200:
-                logging.warning(f"Chipdip API вернул {resp.status} для {item}")
-                return None
-
-            data = await resp.json(content_type=None)
-            if not data or "items" not in data:
-                return None
-
-            # Ищем точное совпадение по артикулу
-            for found in data["items"]:
-                found_name = found.get("Name", "").strip()
-                if item.lower() in found_name.lower():
-                    try:
-                        price_val = float(str(found.get("Price", "0")).replace(",", "."))
-                    except Exception:
-                        price_val = None
-                    url = "https://www.chipdip.ru" + found.get("Url", "")
-                    if price_val:
-                        return price_val, "chipdip.ru", url, found_name
+        data = await fetch_json(session, url, "chipdip.ru", item)
+        if not data or "items" not in data:
+            return None
+
+        # Ищем точное совпадение по артикулу
+        for found in data["items"]:
+            found_name = found.get("Name", "").strip()
+            if item.lower() in found_name.lower():
+                try:
+                    price_val = float(str(found.get("Price", "0")).replace(",", "."))
+                except Exception:
+                    price_val = None
+                url = "https://www.chipdip.ru" + found.get("Url", "")
+                if price_val:
+                    return price_val, "chipdip.ru", url, found_name
     except Exception as e:
         logging.warning(f"Chipdip API error для {item}: {e}")
     return None
@@ -76,7 +106,7 @@ async def process_items(input_file, output_file, progress_callback=None):
     Основной процесс обработки:
     - читает source.csv
     - ищет цены
-    - пишет output.csv
+    - пишет прогон в data/results (Parquet) и output.csv
     """
     results = []
     processed = set()
@@ -100,7 +130,8 @@ async def process_items(input_file, output_file, progress_callback=None):
     total = len(items)
     done = 0
 
-    async with aiohttp.ClientSession() as session:
+    # заголовки и пул соединений (keep-alive, DNS-кэш) — на всю сессию, см. http_session.py
+    async with create_session(HEADERS, stats=conn_stats) as session:
         for item in items:
             if item in processed:
                 done += 1
@@ -121,8 +152,13 @@ async def process_items(input_file, output_file, progress_callback=None):
             if progress_callback:
                 progress_callback(done, total)
 
-    # Сохраняем результат
+    # Сохраняем результат: прогон в колоночном виде, CSV — экспорт из него
+    run_path = results_store.write_run(RESULTS_DIR, OUTPUT_HEADER, results)
     with open(output_file, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
-        writer.writerow(["item", "price_rub", "source_site", "source_url", "match_score"])
+        writer.writerow(OUTPUT_HEADER)
         writer.writerows(results)
+
+    print(f"Прогон: {run_path}")
+    print(f"Кэш ответов: {lookup_cache.stats()}")
+    print(conn_stats.report())
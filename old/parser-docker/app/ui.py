@@ -2,7 +2,8 @@ import streamlit as st
 import asyncio
 import pandas as pd
 import os
-from scraper import process_items
+from scraper import process_items, RESULTS_DIR
+import results_store
 
 st.set_page_config(page_title="Price Scraper", layout="wide")
 st.title("🔍 Price Scraper — мониторинг цен")
@@ -29,7 +30,31 @@ if uploaded_file:
         asyncio.run(process_items("input.csv", output_file, progress_callback=update_progress))
         st.success("✅ Поиск завершен!")
 
-if os.path.exists(output_file):
+
+@st.cache_data
+def load_run(run_id: str) -> pd.DataFrame:
+    # прогон не меняется после записи — читаем Parquet один раз, а не CSV на каждом rerun
+    return results_store.load(RESULTS_DIR, run_id).to_pandas()
+
+
+@st.cache_data
+def load_diff(old_run: str, new_run: str) -> pd.DataFrame:
+    return results_store.price_diff(RESULTS_DIR, old_run, new_run)
+
+
+runs = results_store.runs(RESULTS_DIR)
+if runs:
+    st.subheader("📊 Результаты")
+    run_id = st.selectbox("Прогон", runs[::-1])
+    df = load_run(run_id)
+    st.dataframe(df)
+    st.download_button("📥 Скачать CSV", df.to_csv(index=False), "results.csv")
+
+    older = [r for r in runs if r < run_id]
+    if older:
+        st.subheader(f"📈 Изменения цен с прогона {older[-1]}")
+        st.dataframe(load_diff(older[-1], run_id))
+elif os.path.exists(output_file):
     st.subheader("📊 Результаты")
     df = pd.read_csv(output_file)
     st.dataframe(df)
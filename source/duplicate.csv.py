@@ -1,17 +1,134 @@
+"""
+Удаление дубликатов (без учёта регистра и лишних пробелов) из CSV с одной колонкой.
+
+Файл читается кусками по CHUNK_ROWS строк, поэтому память не растёт
+вместе с размером входа. Вместо самих строк хранятся 64-битные отпечатки
+нормализованных имён (pd.util.hash_pandas_object) — отсортированный
+массив numpy, 8 байт на уникальное значение. Порядок первых вхождений
+сохраняется.
+
+Если уникальных значений настолько много, что не помещаются и отпечатки,
+запустите с --spill DIR: отпечатки с номерами строк раскладываются по
+файлам-корзинам на диске (внешняя сортировка распределением), каждая
+корзина сортируется отдельно, а нужные строки отмечаются в битовой
+карте (1 бит на строку); последним проходом по входу пишутся отмеченные.
+
+Вероятность совпадения отпечатков у разных имён — порядка n² / 2^65
+(для 10 млн строк ~3e-6).
+
+    python source/duplicate.csv.py [вход.csv] [выход.csv] [--spill DIR]
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
 import pandas as pd
 
 # --- Файлы ---
-input_csv = "source/source.csv"          # исходный файл
+input_csv = "source/source.csv"  # исходный файл
 output_csv = "parts_unique.csv"  # файл с уникальными значениями
 
-# --- Чтение CSV ---
-df = pd.read_csv(input_csv, header=None, names=["part_name"])
+CHUNK_ROWS = 200_000  # строк в одном куске
+SPILL_BUCKETS = 64    # файлов-корзин при --spill
+
+
+def read_chunks(path: str):
+    # первая строка (заголовок "Наименование") читается как данные и так же попадает в выход
+    return pd.read_csv(path, header=None, names=["part_name"], dtype=str, keep_default_na=False,
+                       encoding="utf-8-sig", chunksize=CHUNK_ROWS)
+
+
+def fingerprints(names: pd.Series) -> np.ndarray:
+    normalized = names.str.lower().str.split().str.join(" ")
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+def write_chunk(df: pd.DataFrame, path: str, first: bool):
+    # без заголовка: раньше pandas дописывал в начало выхода лишнюю строку "part_name"
+    df.to_csv(path, mode="w" if first else "a", header=False, index=False)
+
+
+def dedup_in_memory(src: str, dst: str):
+    seen = np.empty(0, dtype=np.uint64)  # отсортированные отпечатки уже записанных имён
+    rows = kept = 0
+    for i, chunk in enumerate(read_chunks(src)):
+        fp = fingerprints(chunk["part_name"])
+        # первое вхождение внутри куска...
+        _, first_idx = np.unique(fp, return_index=True)
+        first_idx.sort()
+        fp_first = fp[first_idx]
+        # ...и которого ещё не было в предыдущих кусках
+        new = np.ones(len(fp_first), dtype=bool)
+        if len(seen):
+            pos = np.searchsorted(seen, fp_first).clip(max=len(seen) - 1)
+            new = seen[pos] != fp_first
+        keep = first_idx[new]
+        write_chunk(chunk.iloc[keep], dst, first=i == 0)
+        seen = np.union1d(seen, fp_first[new])
+        rows += len(chunk)
+        kept += len(keep)
+    return rows, kept
+
+
+def dedup_spill(src: str, dst: str, spill_dir: str):
+    with tempfile.TemporaryDirectory(dir=spill_dir) as tmp:
+        # проход 1: (отпечаток, номер строки) → корзины по младшим битам отпечатка
+        buckets = [open(os.path.join(tmp, f"{b:03d}.bin"), "wb") for b in range(SPILL_BUCKETS)]
+        rows = 0
+        try:
+            for chunk in read_chunks(src):
+                fp = fingerprints(chunk["part_name"])
+                pairs = np.empty(len(fp), dtype=[("fp", np.uint64), ("row", np.uint64)])
+                pairs["fp"] = fp
+                pairs["row"] = np.arange(rows, rows + len(fp), dtype=np.uint64)
+                bucket_of = (fp % np.uint64(SPILL_BUCKETS)).astype(np.intp)
+                for b in np.unique(bucket_of):
+                    pairs[bucket_of == b].tofile(buckets[b])
+                rows += len(fp)
+        finally:
+            for f in buckets:
+                f.close()
+
+        # проход 2: в каждой корзине — первое вхождение каждого отпечатка
+        keep = np.zeros((rows + 7) // 8, dtype=np.uint8)
+        for f in buckets:
+            pairs = np.fromfile(f.name, dtype=[("fp", np.uint64), ("row", np.uint64)])
+            pairs.sort(order=["fp", "row"])
+            first = np.ones(len(pairs), dtype=bool)
+            first[1:] = pairs["fp"][1:] != pairs["fp"][:-1]
+            idx = pairs["row"][first]
+            np.bitwise_or.at(keep, idx >> np.uint64(3), np.uint8(1) << (idx & np.uint64(7)).astype(np.uint8))
+            os.remove(f.name)
+
+    # проход 3: пишем отмеченные строки в исходном порядке
+    bits = np.unpackbits(keep, bitorder="little")
+    start = kept = 0
+    for i, chunk in enumerate(read_chunks(src)):
+        mask = bits[start:start + len(chunk)].astype(bool)
+        write_chunk(chunk[mask], dst, first=i == 0)
+        start += len(chunk)
+        kept += int(mask.sum())
+    return rows, kept
+
 
-# --- Удаляем дубликаты без учета регистра ---
-df["part_name_lower"] = df["part_name"].str.lower()  # приводим к нижнему регистру
-df_unique = df.drop_duplicates(subset=["part_name_lower"], keep="first").drop(columns=["part_name_lower"])
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    spill_dir = None
+    if "--spill" in args:
+        i = args.index("--spill")
+        spill_dir = args[i + 1]
+        del args[i:i + 2]
+    if len(args) > 0:
+        input_csv = args[0]
+    if len(args) > 1:
+        output_csv = args[1]
 
-# --- Сохраняем в новый CSV ---
-df_unique.to_csv(output_csv, index=False)
+    if spill_dir:
+        rows, kept = dedup_spill(input_csv, output_csv, spill_dir)
+    else:
+        rows, kept = dedup_in_memory(input_csv, output_csv)
 
-print(f"Дубликаты удалены (без учета регистра), уникальные значения сохранены в {output_csv}")
+    print(f"Дубликаты удалены (без учета регистра): {rows} → {kept} строк, "
+          f"уникальные значения сохранены в {output_csv}")
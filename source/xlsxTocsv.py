@@ -1,15 +1,17 @@
-import pandas as pd
+import csv
 
-def xlsx_onecol_to_csv(input_file: str, output_file: str):
-    # Читаем первый лист Excel
-    df = pd.read_excel(input_file, engine="openpyxl")
+from xlsx_rows import iter_rows
 
-    # Берём только первый столбец
-    df = df.iloc[:, [0]]
 
-    # Сохраняем в CSV без индексов
-    df.to_csv(output_file, index=False, header=True, encoding="utf-8-sig")
-    print(f"Файл {output_file} успешно создан.")
+def xlsx_onecol_to_csv(input_file: str, output_file: str):
+    # Читаем первый лист Excel потоково и берём только первый столбец (с заголовком)
+    with open(output_file, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        rows = 0
+        for (name,) in iter_rows(input_file, columns=(0,), min_row=1):
+            writer.writerow(["" if name is None else name])
+            rows += 1
+    print(f"Файл {output_file} успешно создан ({rows} строк).")
 
 if __name__ == "__main__":
     xlsx_onecol_to_csv("priceSetTable.xlsx", "output.csv")